@@ -0,0 +1,83 @@
+"""
+batchGames.py plays a batch of games across a pool of worker processes.  It
+backs runGames(..., workers=N) in pacman.py and the --workers option.
+
+Each game gets its own seed (seed + game number) and a fresh copy of the
+agents, so a batch gives the same results whichever worker plays which game
+and in whatever order they finish.  Workers send back a small GameRecord
+rather than the Game itself, as soon as each game is over.
+"""
+import multiprocessing
+import pickle
+import random
+import time
+
+class GameRecord:
+  """
+  The outcome of one game played by a worker: its score, whether Pacman
+  won, how many moves Pacman made and how long the agents took (moveTimes
+  holds a util.LatencyHistogram of each agent's move times).  searchStats
+  holds Pacman's search counts when it was created with instrument=True
+  (see searchInstruments.py).
+  """
+  def __init__(self, index, seed, game, wallTime):
+    self.index = index
+    self.seed = seed
+    self.score = game.state.getScore()
+    self.win = game.state.isWin()
+    self.numMoves = len([1 for agentIndex, action in game.moveHistory if agentIndex == 0])
+    self.moveHistory = game.moveHistory
+    self.totalAgentTimes = game.totalAgentTimes
+    self.my_avg_time = game.my_avg_time
+    self.moveTimes = game.moveTimes
+    getGameStats = getattr(game.agents[0], 'getGameStats', None)
+    self.searchStats = getGameStats() if getGameStats is not None else None
+    self.agentCrashed = game.agentCrashed
+    self.wallTime = wallTime
+
+  def getScore(self):
+    return self.score
+
+  def isWin(self):
+    return self.win
+
+  def __repr__(self):
+    return 'GameRecord(game=%d, score=%s, win=%s, moves=%d)' % (self.index, self.score, self.win, self.numMoves)
+
+def runBatch(layout, pacman, ghosts, numGames, workers, seed, catchExceptions=False, timeout=30):
+  """
+  Plays numGames games on a pool of workers and yields a GameRecord for each
+  one as it finishes (not necessarily in game order).
+  """
+  setup = pickle.dumps((layout, pacman, ghosts, catchExceptions, timeout))
+  tasks = [(i, seed + i) for i in range(numGames)]
+  pool = multiprocessing.Pool(workers, _initWorker, (setup,))
+  try:
+    for record in pool.imap_unordered(playTask, tasks, 1):
+      yield record
+    pool.close()
+  finally:
+    pool.terminate()
+    pool.join()
+
+# Worker side.  The pickled setup is kept as bytes and unpickled for every
+# game, so agents never carry state over from one game to the next.
+_setup = None
+
+def _initWorker(setup):
+  global _setup
+  _setup = setup
+
+def playTask(task):
+  "Plays one game in a worker and returns its GameRecord."
+  from pacman import ClassicGameRules
+  import textDisplay
+  index, gameSeed = task
+  layout, pacman, ghosts, catchExceptions, timeout = pickle.loads(_setup)
+  if hasattr(pacman, 'parallel'): pacman.parallel = 0 # Workers can't start pools of their own
+  random.seed(gameSeed)
+  rules = ClassicGameRules(timeout)
+  game = rules.newGame(layout, pacman, ghosts, textDisplay.NullGraphics(), True, catchExceptions)
+  start = time.time()
+  game.runFast()
+  return GameRecord(index, gameSeed, game, time.time() - start)
@@ -0,0 +1,365 @@
+"""
+cellState.py encodes game states as flat tuples of small integers, so that
+search code can generate, hash and compare states without building
+GameState's objects.  Every place an agent can stand, including the points
+half way between cells where scared ghosts stop, has an integer cell id,
+and directions are the ints 0-4 (see DIRECTIONS).
+
+  encoding = getEncoding(layout)              - the cell tables of a layout
+  state = CellState.fromGameState(gameState)  - the encoded state
+  state.toGameState()                         - ... and back
+  state.packed                                - the tuple: food, capsules, score,
+                                                status, then the cell, direction and
+                                                scared timer of each agent
+
+Food is a bitmask in BitGrid's bit order and capsules a bitmask over the
+layout's capsule list.  Successors follow the rules in pacman.py exactly;
+only the bookkeeping GameState keeps for the displays (what was just eaten)
+is left out.  CellState offers the parts of the GameState interface that
+the search agents and evaluation functions use, so the agents in
+submission.py can search on it (cells=True).  Its key is the packed tuple
+itself, so tables keyed by it can't collide.
+"""
+from game import Actions, AgentState, BitGrid, Configuration, Directions
+import util
+
+DIRECTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+DIRECTION_IDS = dict([(direction, i) for i, direction in enumerate(DIRECTIONS)])
+STOP = DIRECTION_IDS[Directions.STOP]
+
+# Positions in the packed tuple; agent i's cell, direction and timer start at AGENTS + 3 * i
+FOOD, CAPSULES, SCORE, STATUS, AGENTS = 0, 1, 2, 3, 4
+PLAYING, WON, LOST = 0, 1, 2
+
+_encodings = {}
+FOOD_LIST_CACHE_SIZE = 4096
+
+def getEncoding(layout):
+  "Returns the CellEncoding of layout, built the first time it is asked for."
+  encoding = _encodings.get(layout)
+  if encoding is None:
+    encoding = _encodings[layout] = CellEncoding(layout)
+  return encoding
+
+class CellEncoding:
+  """
+  The cells of a layout and everything about them the rules need, in
+  lists indexed by cell id (or by cell id * 5 + direction):
+
+    positions[cell]            - the (x, y) position of the cell
+    pacmanActions[cell]        - Pacman's legal actions there
+    ghostActions[cell*5+d]     - a ghost's legal actions there, heading in d
+    moves[cell*5+d]            - the cell a move in d leads to (-1: none)
+    halfMoves[cell*5+d]        - ... at half speed (scared ghosts)
+    nearest[cell]              - the whole cell nearest to it
+    kills[cell]                - the cells within collision distance of it
+    foodBits[cell], capsuleBits[cell] - its bit in the food and capsule masks
+  """
+  def __init__(self, layout):
+    import pacman
+    walls = layout.walls
+    self.layout = layout
+    self.height = walls.height
+    positions = [(x, y) for x in range(walls.width) for y in range(walls.height) if not walls[x][y]]
+    open = set(positions)
+    for x, y in positions[:]:
+      if (x + 1, y) in open: positions.append((x + 0.5, y))
+      if (x, y + 1) in open: positions.append((x, y + 0.5))
+    self.positions = positions
+    self.cellIds = dict([(pos, cell) for cell, pos in enumerate(positions)])
+
+    table = layout.getLegalMoveTable()
+    self.pacmanActions = []
+    self.ghostActions = []
+    self.moves = []
+    self.halfMoves = []
+    self.nearest = []
+    self.kills = []
+    self.foodBits = []
+    self.capsuleBits = []
+    for x, y in positions:
+      byDirection = table.ghost.get((x, y))
+      self.pacmanActions.append(table.pacman.get((x, y), ()))
+      for direction in DIRECTIONS:
+        if byDirection is not None:
+          self.ghostActions.append(byDirection[direction])
+        else:
+          # Between cells a ghost carries straight on
+          self.ghostActions.append((direction,) if direction != Directions.STOP else ())
+        dx, dy = Actions.directionToVector(direction)
+        self.moves.append(self.cellIds.get((x + dx, y + dy), -1))
+        self.halfMoves.append(self.cellIds.get((x + dx * 0.5, y + dy * 0.5), -1))
+      self.nearest.append(self.cellIds[util.nearestPoint((x, y))])
+      near = [(x + dx, y + dy) for dx, dy in [(0, 0), (0.5, 0), (-0.5, 0), (0, 0.5), (0, -0.5)]
+              if abs(dx) + abs(dy) <= pacman.COLLISION_TOLERANCE]
+      self.kills.append(frozenset([self.cellIds[p] for p in near if p in self.cellIds]))
+      whole = x == int(x) and y == int(y)
+      self.foodBits.append(1 << (int(x) * self.height + int(y)) if whole else 0)
+      capsule = (x, y) in layout.capsules and whole
+      self.capsuleBits.append(1 << list(layout.capsules).index((x, y)) if capsule else 0)
+    self.starts = [self.cellIds[pos] for isPacman, pos in layout.agentPositions]
+    self.scaredTime = pacman.SCARED_TIME
+    self.timePenalty = pacman.TIME_PENALTY
+    self.foodLists = {}
+
+  def successor(self, packed, agent, action):
+    """
+    Returns the packed state after agent moves in direction action (an
+    int), by the rules of PacmanRules and GhostRules.
+    """
+    s = list(packed)
+    i = AGENTS + 3 * agent
+    cell, timer = s[i], s[i + 2]
+    if agent == 0:
+      cell = self.moves[cell * 5 + action]
+      s[i], s[i + 1] = cell, action
+      change = -self.timePenalty
+      bit = self.foodBits[cell]
+      if s[FOOD] & bit:
+        change += 10
+        s[FOOD] ^= bit
+        if not s[FOOD]:
+          change += 500
+          s[STATUS] = WON
+      bit = self.capsuleBits[cell]
+      if s[CAPSULES] & bit:
+        s[CAPSULES] ^= bit
+        for j in range(AGENTS + 5, len(s), 3):
+          s[j] = self.scaredTime
+      kills = self.kills[cell]
+      for j in range(AGENTS + 3, len(s), 3):
+        if s[j] in kills:
+          change += self.collide(s, j)
+    else:
+      cell = (self.halfMoves if timer > 0 else self.moves)[cell * 5 + action]
+      if cell < 0: raise Exception('Ghost %d left the cells' % agent)
+      if timer == 1: cell = self.nearest[cell]
+      s[i], s[i + 1], s[i + 2] = cell, action, max(0, timer - 1)
+      change = 0
+      if s[AGENTS] in self.kills[cell]:
+        change += self.collide(s, i)
+    s[SCORE] += change
+    return tuple(s)
+
+  def collide(self, s, i):
+    "Resolves a collision with the ghost at s[i:i+3]; returns the score change."
+    if s[i + 2] > 0:
+      s[i], s[i + 1], s[i + 2] = self.starts[(i - AGENTS) // 3], STOP, 0
+      return 200
+    if s[STATUS] != WON:
+      s[STATUS] = LOST
+      return -500
+    return 0
+
+  def getFoodList(self, food):
+    "Returns the positions of the food in the mask food, as GameState.getFoodList would."
+    foodList = self.foodLists.get(food)
+    if foodList is None:
+      if len(self.foodLists) >= FOOD_LIST_CACHE_SIZE: self.foodLists.clear()
+      grid = BitGrid(self.layout.width, self.layout.height)
+      grid.bits = food
+      foodList = self.foodLists[food] = tuple(grid.asList())
+    return foodList
+
+class CellState:
+  """
+  A game state held as a CellEncoding's packed tuple, with the GameState
+  methods the search agents use.  applyMove and undoMove swap the tuple
+  in place, as GameState's do.
+  """
+  __slots__ = ('encoding', 'packed', '_undoStack')
+
+  def __init__(self, encoding, packed):
+    self.encoding = encoding
+    self.packed = packed
+    self._undoStack = None
+
+  def fromGameState(gameState):
+    "Encodes gameState."
+    encoding = getEncoding(gameState.data.layout)
+    data = gameState.data
+    capsules = 0
+    layoutCapsules = list(encoding.layout.capsules)
+    for capsule in data.capsules:
+      capsules |= 1 << layoutCapsules.index(capsule)
+    food = data.food
+    if not isinstance(food, BitGrid): food = BitGrid.fromGrid(food)
+    status = WON if data._win else LOST if data._lose else PLAYING
+    packed = [food.bits, capsules, data.score, status]
+    for agentState in data.agentStates:
+      configuration = agentState.configuration
+      packed += [encoding.cellIds[configuration.pos], DIRECTION_IDS[configuration.direction], agentState.scaredTimer]
+    return CellState(encoding, tuple(packed))
+  fromGameState = staticmethod(fromGameState)
+
+  def toGameState(self):
+    "Returns the GameState this state encodes."
+    from pacman import GameState
+    encoding, packed = self.encoding, self.packed
+    agents = tuple([(encoding.positions[packed[i]], DIRECTIONS[packed[i + 1]], packed[i + 2])
+                    for i in range(AGENTS, len(packed), 3)])
+    return GameState.unpack(encoding.layout, (agents, packed[FOOD], tuple(self.getCapsules()), packed[SCORE],
+                                              tuple([False] * len(agents)), packed[STATUS] == WON, packed[STATUS] == LOST))
+
+  def getLegalActions(self, agentIndex=0):
+    packed = self.packed
+    if packed[STATUS]: return ()
+    i = AGENTS + 3 * agentIndex
+    if agentIndex == 0:
+      return self.encoding.pacmanActions[packed[i]]
+    return self.encoding.ghostActions[packed[i] * 5 + packed[i + 1]]
+
+  def generateSuccessor(self, agentIndex, action):
+    return CellState(self.encoding, self._successor(agentIndex, action))
+
+  def _successor(self, agentIndex, action):
+    if self.packed[STATUS]: raise Exception('Can\'t generate a successor of a terminal state.')
+    if action not in self.getLegalActions(agentIndex):
+      raise Exception('Illegal action ' + str(action))
+    return self.encoding.successor(self.packed, agentIndex, DIRECTION_IDS[action])
+
+  def applyMove(self, agentIndex, action):
+    packed = self._successor(agentIndex, action)
+    if self._undoStack is None: self._undoStack = []
+    self._undoStack.append(self.packed)
+    self.packed = packed
+
+  def undoMove(self):
+    self.packed = self._undoStack.pop()
+
+  def getNumUndoMoves(self):
+    if self._undoStack is None: return 0
+    return len(self._undoStack)
+
+  def getKey(self):
+    return self.packed
+
+  def copy(self):
+    return CellState(self.encoding, self.packed)
+
+  def __eq__(self, other):
+    return isinstance(other, CellState) and self.packed == other.packed
+
+  def __hash__(self):
+    return hash(self.packed)
+
+  def getNumAgents(self):
+    return (len(self.packed) - AGENTS) // 3
+
+  def isWin(self):
+    return self.packed[STATUS] == WON
+
+  def isLose(self):
+    return self.packed[STATUS] == LOST
+
+  def getScore(self):
+    return self.packed[SCORE]
+
+  def getAgentPosition(self, agentIndex):
+    return self.encoding.positions[self.packed[AGENTS + 3 * agentIndex]]
+
+  def getAgentDirection(self, agentIndex):
+    return DIRECTIONS[self.packed[AGENTS + 3 * agentIndex + 1]]
+
+  def getScaredTimer(self, agentIndex):
+    return self.packed[AGENTS + 3 * agentIndex + 2]
+
+  def getPacmanPosition(self):
+    return self.getAgentPosition(0)
+
+  def getGhostPosition(self, agentIndex):
+    if agentIndex == 0:
+      raise Exception("Pacman's index passed to getGhostPosition")
+    return self.getAgentPosition(agentIndex)
+
+  def getGhostPositions(self):
+    return [self.getAgentPosition(i) for i in range(1, self.getNumAgents())]
+
+  def _agentState(self, agentIndex):
+    encoding = self.encoding
+    start = Configuration(encoding.positions[encoding.starts[agentIndex]], Directions.STOP)
+    agentState = AgentState(start, agentIndex == 0)
+    agentState.configuration = Configuration(self.getAgentPosition(agentIndex), self.getAgentDirection(agentIndex))
+    agentState.scaredTimer = self.getScaredTimer(agentIndex)
+    return agentState
+
+  def getPacmanState(self):
+    return self._agentState(0)
+
+  def getGhostState(self, agentIndex):
+    if agentIndex == 0 or agentIndex >= self.getNumAgents():
+      raise Exception("Invalid index passed to getGhostState")
+    return self._agentState(agentIndex)
+
+  def getGhostStates(self):
+    return [self._agentState(i) for i in range(1, self.getNumAgents())]
+
+  def getCapsules(self):
+    capsules = self.packed[CAPSULES]
+    return [c for i, c in enumerate(self.encoding.layout.capsules) if (capsules >> i) & 1]
+
+  def getNumFood(self):
+    return bin(self.packed[FOOD]).count('1')
+
+  def getFoodList(self):
+    return self.encoding.getFoodList(self.packed[FOOD])
+
+  def getFood(self):
+    layout = self.encoding.layout
+    grid = BitGrid(layout.width, layout.height)
+    grid.bits = self.packed[FOOD]
+    return grid
+
+  def hasFood(self, x, y):
+    return (self.packed[FOOD] >> (x * self.encoding.height + y)) & 1 == 1
+
+  def getWalls(self):
+    return self.encoding.layout.walls
+
+  def hasWall(self, x, y):
+    return self.encoding.layout.walls[x][y]
+
+  def getMazeDistance(self, p, q):
+    return self.encoding.layout.getMazeDistance(p, q)
+
+def scoreEvaluation(state):
+  "submission.scoreEvaluationFunction on a CellState."
+  return state.packed[SCORE]
+
+def betterEvaluation(state):
+  """
+  submission.betterEvaluationFunction on a CellState, read straight off the
+  packed tuple.  The terms are added up in the same order, so the values
+  are exactly equal.
+  """
+  packed = state.packed
+  if packed[STATUS] == LOST:
+    return -10000
+  encoding = state.encoding
+  positions = encoding.positions
+  px, py = positions[packed[AGENTS]]
+  foodList = encoding.getFoodList(packed[FOOD])
+  minDistFood = 1
+  if foodList:
+    minDistFood = min([abs(px - x) + abs(py - y) for x, y in foodList])
+  score = packed[SCORE] + 1/minDistFood
+
+  bad = good = None
+  for i in range(AGENTS + 3, len(packed), 3):
+    x, y = positions[packed[i]]
+    d = abs(px - x) + abs(py - y)
+    if packed[i + 2]:
+      if good is None or d < good: good = d
+    elif bad is None or d < bad: bad = d
+  if bad:
+    score -= 1/bad
+  if good:
+    score += 1/good
+  numCapsule = bin(packed[CAPSULES]).count('1')
+  if numCapsule > 0:
+    score += 1/numCapsule
+  return score
+
+# Evaluation functions in submission.py that have a faster version here
+CELL_EVALUATIONS = {'scoreEvaluationFunction': scoreEvaluation,
+                    'betterEvaluationFunction': betterEvaluation}
@@ -3,10 +3,11 @@ from pacman import *
 from submission import *
 from ghostAgents import *
 from textDisplay import *
+from experiments import latency_line
 
 
 
-def run_game(player, layout_name, file_ptr, ghosts, depth=1):
+def run_game(player, layout_name, file_ptr, ghosts, depth=1, latency_ptr=None):
     layout = getLayout(layout_name)
     if depth > 1:
         player.depth = depth
@@ -22,6 +23,9 @@ def run_game(player, layout_name, file_ptr, ghosts, depth=1):
             '%.2f' % avg_score + ',' +
             '%.2f' % (avg_time * 1e6) + 'E-06\n')
     file_ptr.write(line)
+    if latency_ptr is not None:
+        latency_ptr.write(latency_line(player.__class__.__name__, depth, layout_name,
+                                       mergeMoveTimes(games)[0].getSummary()))
     return
 
 
@@ -37,16 +41,17 @@ if __name__ == '__main__':
     base = time.time()
 
     i = 0
-    with open('expectimax_results_' + layout + '.csv', 'w+') as file_ptr:
+    with open('expectimax_results_' + layout + '.csv', 'w+') as file_ptr, \
+         open('expectimax_latency_' + layout + '.csv', 'w+') as latency_ptr:
         for player in players:
             i += 1
             print('[Experiment ' + str(i) + '] - python pacman.py -l ' + str(layout) + ' -p ' + str(player) + '-a depth=' + str(d) + ' -n 7 -q -g RandomGhost')
-            run_game(player(), layout, file_ptr, Randomghosts, d)
+            run_game(player(), layout, file_ptr, Randomghosts, d, latency_ptr)
 
             i += 1
             print('[Experiment ' + str(i) + '] - python pacman.py -l ' + str(layout) + ' -p ' + str(
                 player) + '-a depth=' + str(d) + ' -n 7 -q -g DirectionalGhost')
-            run_game(player(), layout, file_ptr, Directionalghosts, d)
+            run_game(player(), layout, file_ptr, Directionalghosts, d, latency_ptr)
 
             file_ptr.write('\n')
     file_ptr.close()
@@ -0,0 +1,81 @@
+"""
+Measures what DirectionalExpectimaxAgent's chance-node pruning costs in
+accuracy and saves in time.  States are taken from games the exact agent
+plays against DirectionalGhosts; every setting then searches the same
+states, and its root values and moves are compared with the exact search.
+
+  python experiment_thresholds.py [layout] [depth]
+"""
+from layout import getLayout
+from pacman import *
+from submission import *
+from ghostAgents import *
+import random, sys, time
+
+SETTINGS = [{'star1': 'True'}, {'threshold': '0.05'}, {'threshold': '0.1'}, {'threshold': '0.2'},
+            {'threshold': '0.1', 'star1': 'True'}]
+
+
+def sample_states(layout, depth, num_states, seed=0):
+    random.seed(seed)
+    player = DirectionalExpectimaxAgent(depth=depth)
+    states = []
+    while len(states) < num_states:
+        state = GameState()
+        state.initialize(layout, 2)
+        ghosts = [DirectionalGhost(i + 1) for i in range(state.getNumAgents() - 1)]
+        while not (state.isWin() or state.isLose()) and len(states) < num_states:
+            states.append(state)
+            state = state.generateSuccessor(0, player.getAction(state))
+            for ghost in ghosts:
+                if state.isWin() or state.isLose(): break
+                state = state.generateSuccessor(ghost.index, ghost.getAction(state))
+    return states
+
+
+def search_all(player, states):
+    values, actions, times = [], [], []
+    for state in states:
+        start = time.time()
+        actions.append(player.getAction(state))
+        times.append(time.time() - start)
+        values.append(player.rootValue)
+    return values, actions, times
+
+
+def compareThresholds(layout_name='trickyClassic', depth=2, num_states=100, settings=SETTINGS, file_name=None):
+    """
+    Searches num_states states with the exact agent and with each setting
+    (DirectionalExpectimaxAgent arguments), and prints and returns one row
+    per setting: mean and max root value error, share of moves that
+    changed, mean seconds per move and speedup.
+    """
+    layout = getLayout(layout_name)
+    states = sample_states(layout, str(depth), num_states)
+    exact_values, exact_actions, exact_times = search_all(DirectionalExpectimaxAgent(depth=str(depth)), states)
+    exact_time = sum(exact_times) / len(exact_times)
+
+    rows = [('exact', 0.0, 0.0, 0.0, exact_time, 1.0)]
+    for setting in settings:
+        values, actions, times = search_all(DirectionalExpectimaxAgent(depth=str(depth), **setting), states)
+        errors = [abs(v - e) for v, e in zip(values, exact_values)]
+        changed = len([1 for a, e in zip(actions, exact_actions) if a != e]) / float(len(states))
+        avg_time = sum(times) / len(times)
+        name = ' '.join(['%s=%s' % item for item in sorted(setting.items())])
+        rows.append((name, sum(errors) / len(errors), max(errors), changed, avg_time, exact_time / avg_time))
+
+    print('%d states on %s, depth %d' % (len(states), layout_name, depth))
+    print('%-26s %10s %10s %8s %12s %8s' % ('setting', 'mean err', 'max err', 'changed', 'sec/move', 'speedup'))
+    for row in rows:
+        print('%-26s %10.4f %10.4f %8.2f %12.6f %8.2f' % row)
+    if file_name:
+        with open(file_name, 'w') as file_ptr:
+            for row in rows:
+                file_ptr.write('%s,%d,%s,%.6f,%.6f,%.4f,%.6f,%.4f\n' % ((row[0], depth, layout_name) + row[1:]))
+    return rows
+
+
+if __name__ == '__main__':
+    layout_name = sys.argv[1] if len(sys.argv) > 1 else 'trickyClassic'
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    compareThresholds(layout_name, depth, file_name='thresholds_' + layout_name + '.csv')
@@ -15,7 +15,7 @@ layouts = ['trickyClassic']
 ghosts = [RandomGhost(1), RandomGhost(2)]
 
 
-def run_game(player, layout_name, file_ptr, depth=1):
+def run_game(player, layout_name, file_ptr, depth=1, latency_ptr=None):
     layout = getLayout(layout_name)
     if depth > 1:
         player.depth = depth
@@ -31,24 +31,45 @@ def run_game(player, layout_name, file_ptr, depth=1):
             '%.2f' % avg_score + ',' +
             '%.2f' % (avg_time * 1e6) + 'E-06\n')
     file_ptr.write(line)
+    if latency_ptr is not None:
+        latency_ptr.write(latency_line(player.__class__.__name__, depth, layout_name,
+                                       mergeMoveTimes(games)[0].getSummary()))
     return
 
 
+def latency_line(agent, depth, layout_name, summary):
+    """
+    A line of latency_<layout>.csv, which sits beside results_<layout>.csv
+    (whose columns stats.py reads) with pacman's move times over all the
+    games of a run:
+
+      agent,depth,layout,p50,p90,p99,max seconds per move,total seconds,moves
+
+    The move-time columns are left blank when summary is None.
+    """
+    if summary is None:
+        columns = [''] * 6
+    else:
+        columns = ['%.2f' % (summary[key] * 1e6) + 'E-06' for key in ['p50', 'p90', 'p99', 'max']]
+        columns += ['%.4f' % summary['total'], str(summary['count'])]
+    return ','.join([agent, str(depth), layout_name] + columns) + '\n'
+
+
 if __name__ == '__main__':
     base = time.time()
     i = 0
     for layout in layouts:
-        with open('results_' + layout + '.csv', 'w+') as file_ptr:
+        with open('results_' + layout + '.csv', 'w+') as file_ptr, open('latency_' + layout + '.csv', 'w+') as latency_ptr:
             for player in players:
                 if player in [OriginalReflexAgent, ReflexAgent]:
                     i += 1
                     print('[Experiment ' + str(i) + '] - python pacman.py -l ' + str(layout) + ' -p ' + str(player) + ' -n 7 -q')
-                    run_game(player(), layout, file_ptr)
+                    run_game(player(), layout, file_ptr, latency_ptr=latency_ptr)
                 else:
                     for d in depths:
                         i += 1
                         print('[Experiment ' + str(i) + '] - python pacman.py -l ' + str(layout) + ' -p ' + str(player) + '-a depth=' + str(d) + ' -n 7 -q')
-                        run_game(player(), layout, file_ptr, d)
+                        run_game(player(), layout, file_ptr, d, latency_ptr)
 
             file_ptr.write('\n')
     file_ptr.close()
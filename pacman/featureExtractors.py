@@ -0,0 +1,137 @@
+"""
+featureExtractors.py computes the food, ghost and capsule features that the
+evaluation functions in submission.py are built from, with NumPy, for one
+state or for a whole batch of states at once.
+
+  getFeatures(state)                   - a util.Counter of the features
+  getBatchFeatures(states)             - the same features as arrays, one entry per state
+  betterEvaluation(state)              - submission.betterEvaluationFunction, same values
+  betterEvaluationBatch(states)        - ... for many states, as an array of scores
+
+Food positions are kept as arrays, built once for each food list a search
+sees (states share their food list until food is eaten).  Distances are
+Manhattan distances, as in betterEvaluationFunction.  A batch must come from
+one game, so that every state has the same number of ghosts.
+
+For a single state NumPy's per-call overhead makes this slower than the
+plain Python evaluation; the gain comes from scoring batches (about three
+times fewer microseconds per state for a few hundred states).
+
+NumPy is only needed once one of these functions is called.
+"""
+import util
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+FEATURES = ['numFood', 'minFoodDistance', 'meanFoodDistance', 'numBadGhosts', 'minBadGhostDistance',
+            'minGoodGhostDistance', 'numCapsules', 'minCapsuleDistance']
+
+# Food arrays by id of the food list tuple they were built from.  The entry
+# holds on to the tuple, so its id can't be reused while it is cached.
+_foodArrays = {}
+FOOD_CACHE_SIZE = 256
+
+def _checkNumpy():
+  if np is None: raise ImportError('featureExtractors needs numpy (pip install numpy)')
+
+def _foodArray(foodList):
+  entry = _foodArrays.get(id(foodList))
+  if entry is None or entry[0] is not foodList:
+    if len(_foodArrays) >= FOOD_CACHE_SIZE: _foodArrays.clear()
+    entry = _foodArrays[id(foodList)] = (foodList, np.array(foodList, dtype=float).reshape(-1, 2))
+  return entry[1]
+
+def _segmentMin(distances, counts, empty):
+  """
+  Returns the minimum of each run of counts[i] consecutive distances, or
+  empty for runs of length 0.
+  """
+  result = np.full(len(counts), empty, dtype=float)
+  nonEmpty = counts > 0
+  if nonEmpty.any():
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    result[nonEmpty] = np.minimum.reduceat(distances, starts[nonEmpty])
+  return result
+
+def _segmentDistances(positions, points, counts):
+  """
+  Returns the Manhattan distances from positions[i] to each of the next
+  counts[i] points, for every i, in one array.
+  """
+  if len(points) == 0: return np.zeros(0)
+  return np.abs(points - np.repeat(positions, counts, axis=0)).sum(axis=1)
+
+def getBatchFeatures(gameStates):
+  """
+  Returns a dictionary mapping each name in FEATURES to an array with that
+  feature for every state in gameStates.  Missing things have distance 0,
+  as in getMinDistGhost, except that the food distances of a state without
+  food are 1, as in getMinDistFood.
+  """
+  _checkNumpy()
+  numStates = len(gameStates)
+  numAgents = gameStates[0].getNumAgents() if gameStates else 1
+  agentStates = [state.data.agentStates for state in gameStates]
+  positions = np.array([[agent.getPosition() for agent in agents] for agents in agentStates], dtype=float).reshape(-1, numAgents, 2)
+  pacman = positions[:, 0]
+  features = {}
+
+  foodArrays = [_foodArray(state.getFoodList()) for state in gameStates]
+  foodCounts = np.array([len(food) for food in foodArrays], dtype=int)
+  foodPoints = np.concatenate(foodArrays) if numStates else np.zeros((0, 2))
+  foodDistances = _segmentDistances(pacman, foodPoints, foodCounts)
+  features['numFood'] = foodCounts
+  features['minFoodDistance'] = _segmentMin(foodDistances, foodCounts, 1.0)
+  sums = np.zeros(numStates)
+  if len(foodDistances):
+    np.add.at(sums, np.repeat(np.arange(numStates), foodCounts), foodDistances)
+  features['meanFoodDistance'] = np.where(foodCounts > 0, sums / np.maximum(foodCounts, 1), 1.0)
+
+  scared = np.array([[agent.scaredTimer > 0 for agent in agents[1:]] for agents in agentStates], dtype=bool).reshape(-1, numAgents - 1)
+  ghostDistances = np.abs(positions[:, 1:] - pacman[:, np.newaxis, :]).sum(axis=2)
+  bad = np.where(scared, np.inf, ghostDistances).min(axis=1, initial=np.inf)
+  good = np.where(scared, ghostDistances, np.inf).min(axis=1, initial=np.inf)
+  features['numBadGhosts'] = (~scared).sum(axis=1)
+  features['minBadGhostDistance'] = np.where(np.isinf(bad), 0.0, bad)
+  features['minGoodGhostDistance'] = np.where(np.isinf(good), 0.0, good)
+
+  capsules = [state.getCapsules() for state in gameStates]
+  capsuleCounts = np.array([len(c) for c in capsules], dtype=int)
+  capsulePoints = np.array([p for c in capsules for p in c], dtype=float).reshape(-1, 2)
+  features['numCapsules'] = capsuleCounts
+  features['minCapsuleDistance'] = _segmentMin(_segmentDistances(pacman, capsulePoints, capsuleCounts), capsuleCounts, 0.0)
+  return features
+
+def getFeatures(gameState):
+  "Returns a util.Counter of the features (see getBatchFeatures) of one state."
+  features = util.Counter()
+  for name, values in getBatchFeatures([gameState]).items():
+    features[name] = values[0].item()
+  return features
+
+def _inverse(values):
+  "1 / values where values > 0, else 0."
+  result = np.zeros(len(values))
+  np.divide(1.0, values, out=result, where=values > 0)
+  return result
+
+def betterEvaluationBatch(gameStates):
+  """
+  Returns an array holding betterEvaluationFunction of each state.  The
+  terms are added up in the same order, so the scores are exactly equal.
+  """
+  features = getBatchFeatures(gameStates)
+  scores = np.array([state.getScore() for state in gameStates], dtype=float)
+  scores = scores + 1.0 / features['minFoodDistance']
+  scores = scores - _inverse(features['minBadGhostDistance'])
+  scores = scores + _inverse(features['minGoodGhostDistance'])
+  scores = scores + _inverse(features['numCapsules'].astype(float))
+  lost = np.array([state.isLose() for state in gameStates], dtype=bool)
+  return np.where(lost, -10000.0, scores)
+
+def betterEvaluation(gameState):
+  "betterEvaluationFunction of one state, computed by betterEvaluationBatch."
+  return betterEvaluationBatch([gameState])[0].item()
@@ -58,7 +58,11 @@ class Configuration:
 
   The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
   horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
+
+  Configurations are created for every move, so they have slots rather than
+  an instance dictionary.
   """
+  __slots__ = ('pos', 'direction')
 
   def __init__(self, pos, direction):
     self.pos = pos
@@ -104,7 +108,11 @@ class Configuration:
 class AgentState:
   """
   AgentStates hold the state of an agent (configuration, speed, scared, etc).
+
+  Every successor state copies all of them, so they have slots rather than
+  an instance dictionary.
   """
+  __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer')
 
   def __init__( self, startConfiguration, isPacman ):
     self.start = startConfiguration
@@ -127,8 +135,10 @@ class AgentState:
     return hash(hash(self.configuration) + 13 * hash(self.scaredTimer))
 
   def copy( self ):
-    state = AgentState( self.start, self.isPacman )
+    state = AgentState.__new__( AgentState )
+    state.start = self.start
     state.configuration = self.configuration
+    state.isPacman = self.isPacman
     state.scaredTimer = self.scaredTimer
     return state
 
@@ -260,6 +270,222 @@ def reconstituteGrid(bitRep):
   width, height = bitRep[:2]
   return Grid(width, height, bitRepresentation= bitRep[2:])
 
+class BitGrid:
+  """
+  A drop-in replacement for Grid that stores a boolean grid as a single
+  Python int (a bitboard).  Cell (x,y) lives in bit x * height + y, which is
+  the same cell order Grid uses for asList() and __hash__.
+
+  Because ints are immutable, copy() is O(1), count() is a popcount and the
+  hash is the bitboard itself.  Data is still accessed via grid[x][y].
+
+  A frozen grid (see freeze) refuses writes; its copies are not frozen.
+  """
+  CELLS_PER_INT = 30
+  frozen = False
+
+  def __init__(self, width, height, initialValue=False, bitRepresentation=None):
+    if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
+    self.width = width
+    self.height = height
+    self.bits = 0
+    if initialValue:
+      self.bits = self._mask()
+    if bitRepresentation:
+      self._unpackBits(bitRepresentation)
+
+  def _mask(self):
+    return (1 << (self.width * self.height)) - 1
+
+  def __getitem__(self, x):
+    if x < 0: x += self.width
+    if x < 0 or x >= self.width: raise IndexError('BitGrid column out of range')
+    return BitGridColumn(self, x)
+
+  def __setitem__(self, x, column):
+    for y in range(self.height):
+      self[x][y] = column[y]
+
+  def __len__(self):
+    return self.width
+
+  def get(self, x, y):
+    "Returns the value at (x,y) without building a column view."
+    return (self.bits >> (x * self.height + y)) & 1 == 1
+
+  def __str__(self):
+    out = [[str(self[x][y])[0] for x in range(self.width)] for y in range(self.height)]
+    out.reverse()
+    return '\n'.join([''.join(x) for x in out])
+
+  def __eq__(self, other):
+    if other == None: return False
+    if isinstance(other, BitGrid):
+      return self.bits == other.bits and self.width == other.width and self.height == other.height
+    return self.data == other.data
+
+  def __hash__(self):
+    return hash(self.bits)
+
+  def _getData(self):
+    return [[self.get(x, y) for y in range(self.height)] for x in range(self.width)]
+  data = property(_getData, doc="A list-of-lists view of the grid, for code written against Grid.")
+
+  def freeze(self):
+    "Makes the grid read-only, e.g. because it is shared, and returns it."
+    self.frozen = True
+    return self
+
+  def copy(self):
+    g = BitGrid.__new__(BitGrid)
+    g.width = self.width
+    g.height = self.height
+    g.bits = self.bits
+    return g
+
+  def deepCopy(self):
+    return self.copy()
+
+  def shallowCopy(self):
+    # The bitboard is immutable, so a shallow copy cannot share writes.
+    return self.copy()
+
+  def count(self, item =True ):
+    ones = bin(self.bits).count('1')
+    if item: return ones
+    return self.width * self.height - ones
+
+  def asList(self, key = True):
+    bits = self.bits
+    if not key: bits = ~bits & self._mask()
+    height = self.height
+    list = []
+    while bits:
+      low = bits & -bits
+      index = low.bit_length() - 1
+      list.append( (index // height, index % height) )
+      bits ^= low
+    return list
+
+  def packBits(self):
+    """
+    Returns an efficient int list representation
+
+    (width, height, bitPackedInts...)
+    """
+    bits = [self.width, self.height]
+    currentInt = 0
+    for i in range(self.height * self.width):
+      bit = self.CELLS_PER_INT - (i % self.CELLS_PER_INT) - 1
+      if (self.bits >> i) & 1:
+        currentInt += 2 ** bit
+      if (i + 1) % self.CELLS_PER_INT == 0:
+        bits.append(currentInt)
+        currentInt = 0
+    bits.append(currentInt)
+    return tuple(bits)
+
+  def _unpackBits(self, bits):
+    """
+    Fills in data from a bit-level representation
+    """
+    cell = 0
+    for packed in bits:
+      for i in range(self.CELLS_PER_INT):
+        if cell == self.width * self.height: break
+        if (packed >> (self.CELLS_PER_INT - i - 1)) & 1:
+          self.bits |= 1 << cell
+        cell += 1
+
+  def fromGrid(grid):
+    "Builds a BitGrid holding the same booleans as a list-backed Grid."
+    g = BitGrid(grid.width, grid.height)
+    for x, y in grid.asList():
+      g.bits |= 1 << (x * grid.height + y)
+    return g
+  fromGrid = staticmethod(fromGrid)
+
+class BitGridColumn:
+  """
+  A view of one column of a BitGrid, so that grid[x][y] reads and writes the
+  parent's bitboard.
+  """
+  __slots__ = ('grid', 'offset')
+
+  def __init__(self, grid, x):
+    self.grid = grid
+    self.offset = x * grid.height
+
+  def _index(self, y):
+    height = self.grid.height
+    if y < 0: y += height
+    if y < 0 or y >= height: raise IndexError('BitGrid row out of range')
+    return self.offset + y
+
+  def __getitem__(self, y):
+    return (self.grid.bits >> self._index(y)) & 1 == 1
+
+  def __setitem__(self, y, value):
+    if value not in [False, True]: raise Exception('Grids can only contain booleans')
+    if self.grid.frozen: raise Exception('Frozen grids can\'t be changed; change a copy')
+    bit = 1 << self._index(y)
+    if value:
+      self.grid.bits |= bit
+    else:
+      self.grid.bits &= ~bit
+
+  def __len__(self):
+    return self.grid.height
+
+  def __iter__(self):
+    bits = self.grid.bits >> self.offset
+    for y in range(self.grid.height):
+      yield (bits >> y) & 1 == 1
+
+class ZobristTable:
+  """
+  Random 64-bit keys for the pieces of a Pacman position: each agent's
+  (position, direction, scared timer) combination, each food pellet and each
+  capsule.  The hash of a state is the XOR of the keys of everything on the
+  board, so a move only has to XOR out the keys that changed and XOR in the
+  new ones.
+
+  Keys are drawn lazily from a private random generator (the game's global
+  random state is left alone).  Share one table per layout so that every
+  state of a game is hashed consistently; see Layout.getZobristTable.
+  """
+  def __init__(self, seed=0):
+    import random
+    self.random = random.Random(seed)
+    self.agentKeys = {}
+    self.foodKeys = {}
+    self.capsuleKeys = {}
+
+  def _lookup(self, keys, item):
+    key = keys.get(item)
+    if key is None:
+      key = keys[item] = self.random.getrandbits(64)
+    return key
+
+  def agentKey(self, index, agentState):
+    configuration = agentState.configuration
+    return self._lookup(self.agentKeys, (index, configuration.pos, configuration.direction, agentState.scaredTimer))
+
+  def foodKey(self, position):
+    return self._lookup(self.foodKeys, position)
+
+  def capsuleKey(self, position):
+    return self._lookup(self.capsuleKeys, position)
+
+  def hashBoard(self, food, capsules):
+    "Returns the key of the food grid and capsule list."
+    h = 0
+    for position in food.asList():
+      h ^= self.foodKey(position)
+    for position in capsules:
+      h ^= self.capsuleKey(position)
+    return h
+
 ####################################
 # Parts you shouldn't have to read #
 ####################################
@@ -348,6 +574,36 @@ class Actions:
     return (x + dx, y + dy)
   getSuccessor = staticmethod(getSuccessor)
 
+class LegalMoveTable:
+  """
+  The legal actions from every open cell of a layout, worked out once with
+  Actions.getPossibleActions and the rules of pacman.py: Pacman can't stop,
+  and ghosts can't stop or turn around except in a dead end.
+
+    pacman[pos]             - Pacman's actions at pos
+    ghost[pos][direction]   - a ghost's actions at pos, heading in direction
+
+  Actions are tuples, shared by every state.  Only whole-cell positions are
+  in the table; agents between cells (scared ghosts) must look elsewhere.
+  """
+  def __init__(self, walls):
+    self.pacman = {}
+    self.ghost = {}
+    for x in range(walls.width):
+      for y in range(walls.height):
+        if walls[x][y]: continue
+        possible = Actions.getPossibleActions(Configuration((x, y), Directions.STOP), walls)
+        moves = tuple([action for action in possible if action != Directions.STOP])
+        self.pacman[(x, y)] = moves
+        byDirection = {}
+        for direction in Actions._directions:
+          reverse = Actions.reverseDirection(direction)
+          if reverse in moves and len(moves) > 1:
+            byDirection[direction] = tuple([action for action in moves if action != reverse])
+          else:
+            byDirection[direction] = moves
+        self.ghost[(x, y)] = byDirection
+
 class GameStateData:
   """
 
@@ -363,6 +619,10 @@ class GameStateData:
       self.layout = prevState.layout
       self._eaten = prevState._eaten
       self.score = prevState.score
+      self._numFood = prevState._numFood
+      self._foodList = prevState._foodList
+      self._hash = prevState._hash
+      self._agentKeys = prevState._agentKeys
     self._foodEaten = None
     self._capsuleEaten = None
     self._agentMoved = None
@@ -379,11 +639,59 @@ class GameStateData:
     state._capsuleEaten = self._capsuleEaten
     return state
 
+  def removeFood( self, position ):
+    """
+    Clears the food at position, keeping the remaining-food count and the
+    food position list in step with the grid.
+    """
+    x, y = position
+    self.food = self.food.copy()
+    self.food[x][y] = False
+    self._numFood -= 1
+    self._foodList = tuple([p for p in self._foodList if p != position])
+    self._hash ^= self.layout.getZobristTable().foodKey(position)
+
+  def removeCapsule( self, position ):
+    """
+    Removes the capsule at position.  The list is replaced rather than
+    edited, since it may be shared with other states.
+    """
+    self.capsules = [c for c in self.capsules if c != position]
+    self._hash ^= self.layout.getZobristTable().capsuleKey(position)
+
+  def updateAgentKeys( self, indices ):
+    """
+    Updates the Zobrist hash after the agents at indices have changed
+    position, direction or scared timer.
+    """
+    zobrist = self.layout.getZobristTable()
+    agentKeys = list(self._agentKeys)
+    h = self._hash
+    for index in indices:
+      key = zobrist.agentKey(index, self.agentStates[index])
+      h ^= agentKeys[index] ^ key
+      agentKeys[index] = key
+    self._hash = h
+    self._agentKeys = tuple(agentKeys)
+
+  def rehash( self ):
+    """
+    Recomputes the Zobrist hash from scratch, e.g. after the state was built
+    by hand or unpickled in another process (whose keys differ).
+    """
+    zobrist = self.layout.getZobristTable()
+    self._agentKeys = tuple([zobrist.agentKey(i, s) for i, s in enumerate(self.agentStates)])
+    h = zobrist.hashBoard(self.food, self.capsules)
+    for key in self._agentKeys:
+      h ^= key
+    self._hash = h
+
+  def __setstate__( self, state ):
+    self.__dict__.update(state)
+    self.rehash()
+
   def copyAgentStates( self, agentStates ):
-    copiedStates = []
-    for agentState in agentStates:
-      copiedStates.append( agentState.copy() )
-    return copiedStates
+    return [agentState.copy() for agentState in agentStates]
 
   def __eq__( self, other ):
     """
@@ -399,15 +707,10 @@ class GameStateData:
 
   def __hash__( self ):
     """
-    Allows states to be keys of dictionaries.
+    Allows states to be keys of dictionaries.  The Zobrist hash is kept up to
+    date as the state changes, so this is O(1).
     """
-    for i, state in enumerate( self.agentStates ):
-      try:
-        int(hash(state))
-      except TypeError as e:
-        print(e)
-        #hash(state)
-    return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+    return self._hash ^ hash(self.score)
 
   def __str__( self ):
     width, height = self.layout.width, self.layout.height
@@ -466,7 +769,9 @@ class GameStateData:
     Creates an initial game state from a layout array (see layout.py).
     """
     self.food = layout.food.copy()
-    self.capsules = layout.capsules[:]
+    self._numFood = self.food.count()
+    self._foodList = tuple(self.food.asList())
+    self.capsules = list(layout.capsules)
     self.layout = layout
     self.score = 0
     self.scoreChange = 0
@@ -479,6 +784,7 @@ class GameStateData:
         else: numGhosts += 1
       self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
     self._eaten = [False for a in self.agentStates]
+    self.rehash()
 
 class Game:
   """
@@ -499,7 +805,14 @@ class Game:
     self.totalAgentTimeWarnings = [0 for agent in agents]
     #self.agentTimeout = False
     self.agentTimeout = True #Manor - 27/12/18
-    self.my_avg_time = 0
+    # How long each agent took to choose its moves
+    self.moveTimes = [LatencyHistogram() for agent in agents]
+    self.watchdog = None
+
+  def my_avg_time(self):
+    "Pacman's mean move time, in seconds."
+    return self.moveTimes[0].getMean()
+  my_avg_time = property(my_avg_time)
 
   def getProgress(self):
     if self.gameOver:
@@ -507,6 +820,14 @@ class Game:
     else:
       return self.rules.getProgress(self)
 
+  def recordOverrun( self, agentIndex, timeTaken ):
+    """
+    Counts a call that the watchdog stopped at its time limit: its time goes
+    into totalAgentTimes and it counts as a time warning.
+    """
+    self.totalAgentTimes[agentIndex] += timeTaken
+    self.totalAgentTimeWarnings[agentIndex] += 1
+
   def _agentCrash( self, agentIndex, quiet=False):
     "Helper method for handling agent crashes"
     if not quiet: traceback.print_exc()
@@ -538,8 +859,17 @@ class Game:
 
   def run( self ):
     """
-    Main control loop for game play.
+    Main control loop for game play.  With catchExceptions the agents' calls
+    are timed by one Watchdog (util.py) for the whole game.
     """
+    if self.catchExceptions: self.watchdog = Watchdog()
+    try:
+      self._run()
+    finally:
+      if self.watchdog is not None: self.watchdog.close()
+      self.watchdog = None
+
+  def _run( self ):
     self.display.initialize(self.state.data)
     self.numMoves = 0
 
@@ -556,13 +886,13 @@ class Game:
         self.mute()
         if self.catchExceptions:
           try:
-            timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
+            start_time = time.time()
             try:
-              start_time = time.time()
-              timed_func(self.state.deepCopy())
+              self.watchdog.call(self.rules.getMaxStartupTime(i), agent.registerInitialState, self.state.deepCopy())
               time_taken = time.time() - start_time
               self.totalAgentTimes[i] += time_taken
             except TimeoutFunctionException:
+              self.recordOverrun(i, time.time() - start_time)
               print("Agent %d ran out of time on startup!" % i)
               self.unmute()
               self.agentTimeout = True
@@ -580,7 +910,6 @@ class Game:
     agentIndex = self.startingIndex
     numAgents = len( self.agents )
 
-    my_counter = 0
     while not self.gameOver:
       # Fetch the next agent
       agent = self.agents[agentIndex]
@@ -591,10 +920,9 @@ class Game:
         self.mute()
         if self.catchExceptions:
           try:
-            timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
+            start_time = time.time()
             try:
-              start_time = time.time()
-              observation = timed_func(self.state.deepCopy())
+              observation = self.watchdog.call(self.rules.getMoveTimeout(agentIndex), agent.observationFunction, self.state.deepCopy())
             except TimeoutFunctionException:
               skip_action = True
             move_time += time.time() - start_time
@@ -614,13 +942,15 @@ class Game:
       self.mute()
       if self.catchExceptions:
         try:
-          timed_func = TimeoutFunction(agent.getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
+          start_time = time.time()
           try:
-            start_time = time.time()
             if skip_action:
               raise TimeoutFunctionException()
-            action = timed_func( observation )
+            action = self.watchdog.call(self.rules.getMoveTimeout(agentIndex) - move_time, agent.getAction, observation)
           except TimeoutFunctionException:
+            move_time += time.time() - start_time
+            self.recordOverrun(agentIndex, move_time)
+            self.moveTimes[agentIndex].add(move_time)
             print("Agent %d timed out on a single move!" % agentIndex)
             self.agentTimeout = True
             self.unmute()
@@ -628,6 +958,7 @@ class Game:
             return
 
           move_time += time.time() - start_time
+          self.moveTimes[agentIndex].add(move_time)
 
           if move_time > self.rules.getMoveWarningTime(agentIndex):
             self.totalAgentTimeWarnings[agentIndex] += 1
@@ -652,12 +983,9 @@ class Game:
           self._agentCrash(agentIndex)
           return
       else:
-        my_base_time = time.time()
+        start_time = time.perf_counter()
         action = agent.getAction(observation)
-        if agent == self.agents[0]:
-          my_move_time = time.time() - my_base_time
-          self.my_avg_time = (self.my_avg_time * my_counter + my_move_time) / (my_counter + 1)
-          my_counter += 1
+        self.moveTimes[agentIndex].add(time.perf_counter() - start_time)
 
       self.unmute()
 
@@ -702,6 +1030,52 @@ class Game:
           return
     self.display.finish()
 
+  def runFast( self ):
+    """
+    Headless control loop for simulations: plays the same game as run(), but
+    never touches the display or redirects output.  Agents without an
+    observationFunction get a light copy of the state (see GameState.copy)
+    instead of a deep one.  Timeouts are not enforced, so games that
+    catch exceptions go through run().
+    """
+    if self.catchExceptions: return self.run()
+    self.numMoves = 0
+
+    for i, agent in enumerate(self.agents):
+      if not agent:
+        self._agentCrash(i, quiet=True)
+        return
+      if hasattr(agent, 'registerInitialState'):
+        agent.registerInitialState(self.state.deepCopy())
+    observers = [hasattr(agent, 'observationFunction') for agent in self.agents]
+
+    agentIndex = self.startingIndex
+    numAgents = len( self.agents )
+    moveHistory = self.moveHistory
+    moveTimes = self.moveTimes
+    perf_counter = time.perf_counter
+    rules = self.rules
+
+    while not self.gameOver:
+      agent = self.agents[agentIndex]
+      if observers[agentIndex]:
+        observation = agent.observationFunction(self.state.deepCopy())
+      else:
+        observation = self.state.copy()
+
+      start_time = perf_counter()
+      action = agent.getAction(observation)
+      moveTimes[agentIndex].add(perf_counter() - start_time)
+
+      moveHistory.append( (agentIndex, action) )
+      self.state = self.state.generateSuccessor( agentIndex, action )
+      rules.process(self.state, self)
+      agentIndex = ( agentIndex + 1 ) % numAgents
+
+    for agent in self.agents:
+      if hasattr(agent, 'final'):
+        agent.final( self.state )
+
 
 
 
@@ -1,26 +1,56 @@
 from util import manhattanDistance
 from game import Grid
+from game import BitGrid
+from game import ZobristTable
+from game import LegalMoveTable
+from array import array
+from collections import deque
 import os
 import random
 from functools import reduce
+import layoutCache
 
 VISIBILITY_MATRIX_CACHE = {}
+ZOBRIST_CACHE = {}
+DISTANCE_CACHE = {}
+LAYOUT_CACHE = {}
 
 class Layout:
   """
   A Layout manages the static information about the game board.
+
+  Layouts are immutable once built: the grids are frozen and the capsule
+  and agent lists are tuples.  States share their layout, so deepCopy
+  returns the layout itself, and layouts compare and hash by their text.
+  getLayout hands out one shared instance per layout text.
   """
   
   def __init__(self, layoutText):
     self.width = len(layoutText[0])
     self.height= len(layoutText)
-    self.walls = Grid(self.width, self.height, False)
-    self.food = Grid(self.width, self.height, False)
+    self.walls = BitGrid(self.width, self.height, False)
+    self.food = BitGrid(self.width, self.height, False)
     self.capsules = []
     self.agentPositions = []
     self.numGhosts = 0
-    self.processLayoutText(layoutText)
     self.layoutText = layoutText
+    self.zobrist = None
+    self.distances = None
+    self.legalMoves = None
+    cached = layoutCache.load(layoutText)
+    if cached is None:
+      self.processLayoutText(layoutText)
+    else:
+      self.walls.bits = cached.walls
+      self.food.bits = cached.food
+      self.capsules = cached.capsules[:]
+      self.agentPositions = cached.agentPositions[:]
+      self.numGhosts = cached.numGhosts
+      self.distances = cached.distances
+    self.walls.freeze()
+    self.food.freeze()
+    self.capsules = tuple(self.capsules)
+    self.agentPositions = tuple(self.agentPositions)
     # self.initializeVisibilityMatrix()
     
   def getNumGhosts(self):
@@ -47,6 +77,49 @@ class Layout:
     else:
       self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
       
+  def getZobristTable(self):
+    """
+    Returns the ZobristTable used to hash states on this layout.  Copies of a
+    layout share one table, so their states hash alike.
+    """
+    if self.zobrist is None:
+      key = "\n".join(self.layoutText)
+      if key not in ZOBRIST_CACHE:
+        ZOBRIST_CACHE[key] = ZobristTable()
+      self.zobrist = ZOBRIST_CACHE[key]
+    return self.zobrist
+
+  def getLegalMoveTable(self):
+    "Returns the game.LegalMoveTable of this layout, built on first use."
+    if self.legalMoves is None:
+      self.legalMoves = LegalMoveTable(self.walls)
+    return self.legalMoves
+
+  def getMazeDistances(self):
+    """
+    Returns the MazeDistances of this layout, read from the layoutCache or
+    else computed (and saved there) the first time any layout with the same
+    text asks.
+    """
+    if self.distances is None:
+      key = "\n".join(self.layoutText)
+      if key not in DISTANCE_CACHE:
+        cached = layoutCache.load(self.layoutText)
+        if cached is not None:
+          DISTANCE_CACHE[key] = cached.distances
+        else:
+          DISTANCE_CACHE[key] = MazeDistances.fromWalls(self.walls)
+          layoutCache.save(self, DISTANCE_CACHE[key])
+      self.distances = DISTANCE_CACHE[key]
+    return self.distances
+
+  def getMazeDistance(self, p, q):
+    """
+    Returns the length of the shortest path between positions p and q that
+    keeps out of the walls.
+    """
+    return self.getMazeDistances().getDistance(p, q)
+
   def isWall(self, pos):
     x, col = pos
     return self.walls[x][col]
@@ -74,9 +147,29 @@ class Layout:
   
   def __str__(self):
     return "\n".join(self.layoutText)
+
+  def __eq__(self, other):
+    return isinstance(other, Layout) and self.layoutText == other.layoutText
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __hash__(self):
+    return hash(tuple(self.layoutText))
+
+  def __getstate__(self):
+    # Cached distances may be views onto a mapped file, and the Zobrist
+    # table is shared through ZOBRIST_CACHE; the receiving process looks
+    # them up again.
+    state = self.__dict__.copy()
+    state['distances'] = None
+    state['legalMoves'] = None
+    state['zobrist'] = None
+    return state
     
   def deepCopy(self):
-    return Layout(self.layoutText[:])
+    # Layouts never change, so copies can share this one
+    return self
     
   def processLayoutText(self, layoutText):
     """
@@ -131,5 +224,94 @@ def getLayout(name, back = 2):
 def tryToLoad(fullname):
   if(not os.path.exists(fullname)): return None
   f = open(fullname)
-  try: return Layout([line.strip() for line in f])
-  finally: f.close()
\ No newline at end of file
+  try: return getSharedLayout([line.strip() for line in f])
+  finally: f.close()
+
+def getSharedLayout(layoutText):
+  "Returns the one Layout built for layoutText, building it the first time."
+  key = "\n".join(layoutText)
+  if key not in LAYOUT_CACHE:
+    LAYOUT_CACHE[key] = Layout(layoutText)
+  return LAYOUT_CACHE[key]
+
+UNREACHABLE = 0xFFFF
+
+class MazeDistances:
+  """
+  True (breadth-first search) distances between all pairs of open cells of
+  a maze.  Open cells are numbered in x-major order; cellIds maps the index
+  x * height + y of a cell to its id (-1 for walls), and the distance from
+  cell i to cell j is table[i * numCells + j], or UNREACHABLE.
+  """
+
+  def __init__(self, width, height, cellIds, neighbors, table = None):
+    self.width = width
+    self.height = height
+    self.cellIds = cellIds
+    self.neighbors = neighbors
+    self.numCells = len(neighbors)
+    self.cells = [None] * self.numCells
+    for index in range(width * height):
+      if cellIds[index] >= 0: self.cells[cellIds[index]] = (index // height, index % height)
+    self.table = table
+    if table is None:
+      self.table = array('H', [UNREACHABLE]) * (self.numCells * self.numCells)
+      for source in range(self.numCells):
+        self._search(source)
+
+  @staticmethod
+  def fromWalls(walls):
+    "Numbers the open cells of walls and searches from each one."
+    width, height = walls.width, walls.height
+    cellIds = array('i', [-1] * (width * height))
+    cells = []
+    for x in range(width):
+      for y in range(height):
+        if not walls[x][y]:
+          cellIds[x * height + y] = len(cells)
+          cells.append((x, y))
+    neighbors = [[cellIds[nx * height + ny]
+                  for nx, ny in ((x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y))
+                  if 0 <= nx < width and 0 <= ny < height and not walls[nx][ny]]
+                 for x, y in cells]
+    return MazeDistances(width, height, cellIds, neighbors)
+
+  def _search(self, source):
+    table, neighbors, row = self.table, self.neighbors, source * self.numCells
+    table[row + source] = 0
+    frontier = deque([source])
+    while frontier:
+      cell = frontier.popleft()
+      distance = table[row + cell] + 1
+      for neighbor in neighbors[cell]:
+        if table[row + neighbor] == UNREACHABLE:
+          table[row + neighbor] = distance
+          frontier.append(neighbor)
+
+  def getCellId(self, pos):
+    x, y = pos
+    return self.cellIds[x * self.height + y]
+
+  def _anchors(self, pos):
+    """
+    Returns the (cell id, extra distance) pairs to measure from.  Scared
+    ghosts move half a square at a time and so may sit between two cells.
+    """
+    x, y = pos
+    if x == int(x) and y == int(y):
+      return [(self.cellIds[int(x) * self.height + int(y)], 0)]
+    cells = set([(int(x), int(y)), (int(x + 0.5), int(y + 0.5))])
+    return [(self.cellIds[cx * self.height + cy], 0.5) for cx, cy in cells]
+
+  def getDistance(self, p, q):
+    """
+    Returns the maze distance between positions p and q, neither of which
+    may be a wall.  Positions between two cells count the half step to the
+    nearer one.
+    """
+    height, cellIds = self.height, self.cellIds
+    try:
+      return self.table[cellIds[p[0] * height + p[1]] * self.numCells + cellIds[q[0] * height + q[1]]]
+    except TypeError:
+      return min([self.table[i * self.numCells + j] + di + dj
+                  for i, di in self._anchors(p) for j, dj in self._anchors(q)])
@@ -0,0 +1,149 @@
+"""
+layoutCache.py keeps what is worth precomputing about a layout on disk, so
+that every run and every worker process doesn't redo it: the parsed walls,
+food, capsules and agent positions, the open-cell adjacency and the
+all-pairs maze distances (see layout.MazeDistances).
+
+Each layout is stored in one binary file named after the hash of its text
+and the format version, in CACHE_DIR (the PACMAN_LAYOUT_CACHE environment
+variable; set it empty to turn the cache off).  Files are opened with mmap,
+read-only: the cell ids, adjacency and distance table are memoryviews onto
+the mapped file, so processes share the pages instead of copying them.
+
+Files hold native-endian machine words and are not meant to be moved
+between machines.
+"""
+from array import array
+import hashlib
+import mmap
+import os
+import struct
+
+VERSION = 1
+MAGIC = b'PACL'
+CACHE_DIR = os.environ.get('PACMAN_LAYOUT_CACHE',
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), '.layoutcache'))
+
+# magic, version, width, height, numCells, numEdges, numCapsules, numAgents, numGhosts
+HEADER = struct.Struct('=4s8I')
+
+# The result of reading each layout text, including misses, so that
+# Layout copies don't go back to the disk.
+_loaded = {}
+
+class CachedLayout:
+  """
+  The contents of one cache file.  grids are BitGrid bitboards (ints),
+  capsules and agentPositions are in the form Layout uses, and distances is
+  a layout.MazeDistances backed by the mapped file.
+  """
+  def __init__(self, walls, food, capsules, agentPositions, numGhosts, distances):
+    self.walls = walls
+    self.food = food
+    self.capsules = capsules
+    self.agentPositions = agentPositions
+    self.numGhosts = numGhosts
+    self.distances = distances
+
+def getKey(layoutText):
+  return hashlib.sha1("\n".join(layoutText).encode('utf-8')).hexdigest()
+
+def getPath(layoutText):
+  return os.path.join(CACHE_DIR, '%s-v%d.bin' % (getKey(layoutText), VERSION))
+
+def load(layoutText):
+  """
+  Returns the CachedLayout stored for layoutText, or None if there is none
+  (or the cache is off or the file is from another version).
+  """
+  key = "\n".join(layoutText)
+  if key not in _loaded:
+    _loaded[key] = _read(layoutText)
+  return _loaded[key]
+
+def _read(layoutText):
+  if not CACHE_DIR: return None
+  try:
+    with open(getPath(layoutText), 'rb') as f:
+      buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  except (IOError, OSError, ValueError):
+    return None
+  if len(buffer) < HEADER.size: return None
+  magic, version, width, height, numCells, numEdges, numCapsules, numAgents, numGhosts = HEADER.unpack_from(buffer, 0)
+  if magic != MAGIC or version != VERSION: return None
+
+  view = memoryview(buffer)
+  sections = _layoutSections(width, height, numCells, numEdges, numCapsules, numAgents)
+  if sections[-1][1] > len(buffer): return None
+  def section(index, format):
+    start, end = sections[index]
+    return view[start:end].cast(format)
+
+  gridBytes = sections[0][1] - sections[0][0]
+  walls = int.from_bytes(view[sections[0][0]:sections[0][0] + gridBytes], 'little')
+  food = int.from_bytes(view[sections[1][0]:sections[1][0] + gridBytes], 'little')
+  capsuleWords = section(2, 'i')
+  capsules = [(capsuleWords[i], capsuleWords[i + 1]) for i in range(0, 2 * numCapsules, 2)]
+  agentWords = section(3, 'i')
+  agentPositions = [(agentWords[i] == 1, (agentWords[i + 1], agentWords[i + 2])) for i in range(0, 3 * numAgents, 3)]
+  offsets, edges = section(5, 'i'), section(6, 'i')
+  neighbors = [list(edges[offsets[i]:offsets[i + 1]]) for i in range(numCells)]
+
+  import layout
+  distances = layout.MazeDistances(width, height, section(4, 'i'), neighbors, section(7, 'H'))
+  return CachedLayout(walls, food, capsules, agentPositions, numGhosts, distances)
+
+def _layoutSections(width, height, numCells, numEdges, numCapsules, numAgents):
+  """
+  Returns the (start, end) byte ranges of the sections following the header:
+  walls, food, capsules, agent positions, cell ids, adjacency offsets,
+  adjacency and distances.  Every section starts on a 4 byte boundary.
+  """
+  gridBytes = (width * height + 7) // 8
+  sizes = [gridBytes, gridBytes, 4 * 2 * numCapsules, 4 * 3 * numAgents, 4 * width * height,
+           4 * (numCells + 1), 4 * numEdges, 2 * numCells * numCells]
+  sections = []
+  start = HEADER.size
+  for size in sizes:
+    sections.append((start, start + size))
+    start = (start + size + 3) & ~3
+  return sections
+
+def save(layout, distances):
+  """
+  Writes the cache file for layout, whose maze distances have just been
+  computed.  The file is written under a temporary name and renamed, so
+  readers in other processes never see half of it.  Failing to write (e.g.
+  on a read-only checkout) just leaves the layout uncached.
+  """
+  if not CACHE_DIR: return
+  width, height, numCells = layout.width, layout.height, distances.numCells
+  offsets = array('i', [0])
+  edges = array('i')
+  for cellNeighbors in distances.neighbors:
+    edges.extend(cellNeighbors)
+    offsets.append(len(edges))
+  capsules = array('i', [c for capsule in layout.capsules for c in capsule])
+  agents = array('i', [w for isPacman, (x, y) in layout.agentPositions for w in (int(isPacman), x, y)])
+
+  gridBytes = (width * height + 7) // 8
+  contents = [layout.walls.bits.to_bytes(gridBytes, 'little'), layout.food.bits.to_bytes(gridBytes, 'little'),
+              capsules.tobytes(), agents.tobytes(), bytes(distances.cellIds),
+              offsets.tobytes(), edges.tobytes(), bytes(distances.table)]
+  sections = _layoutSections(width, height, numCells, len(edges), len(layout.capsules), len(layout.agentPositions))
+  data = bytearray(sections[-1][1])
+  HEADER.pack_into(data, 0, MAGIC, VERSION, width, height, numCells, len(edges),
+                   len(layout.capsules), len(layout.agentPositions), layout.numGhosts)
+  for (start, end), content in zip(sections, contents):
+    data[start:end] = content
+
+  path = getPath(layout.layoutText)
+  temp = '%s.%d.tmp' % (path, os.getpid())
+  try:
+    if not os.path.isdir(CACHE_DIR): os.makedirs(CACHE_DIR)
+    with open(temp, 'wb') as f:
+      f.write(data)
+    os.replace(temp, path)
+  except (IOError, OSError):
+    try: os.remove(temp)
+    except OSError: pass
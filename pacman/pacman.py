@@ -29,6 +29,8 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
+from game import BitGrid
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
@@ -61,7 +63,7 @@ class GameState:
     """
     Returns the legal actions for the agent specified.
     """
-    if self.isWin() or self.isLose(): return []
+    if self.isWin() or self.isLose(): return ()
 
     if agentIndex == 0:  # Pacman is moving
       return PacmanRules.getLegalActions( self )
@@ -77,27 +79,92 @@ class GameState:
 
     # Copy current state
     state = GameState(self)
+    state._applyAction( agentIndex, action )
+    return state
+
+  def applyMove( self, agentIndex, action ):
+    """
+    Applies the specified agent's action to this state in place, instead of
+    allocating a successor.  Every applyMove must be matched by an undoMove,
+    which restores the state exactly (score, timers, food, capsules, win/lose).
+
+    This is meant for search code that walks one working state up and down
+    the game tree:
+
+      state.applyMove(agent, action)
+      value = search(state)
+      state.undoMove()
+    """
+    if self.isWin() or self.isLose(): raise Exception('Can\'t generate a successor of a terminal state.')
 
+    data = self.data
+    if self._undoStack is None: self._undoStack = []
+    self._undoStack.append( ( [(s.configuration, s.scaredTimer) for s in data.agentStates],
+                              data._hash, data._agentKeys,
+                              data.food, data._numFood, data._foodList, data.capsules,
+                              data._eaten, data.score, data.scoreChange,
+                              data._foodEaten, data._capsuleEaten, data._agentMoved ) )
+
+    # Clear the per-move fields a fresh GameStateData would start with
+    data._foodEaten = None
+    data._capsuleEaten = None
+    data._agentMoved = None
+    data.scoreChange = 0
+    self._applyAction( agentIndex, action )
+
+  def undoMove( self ):
+    """
+    Reverts the most recent applyMove.
+    """
+    data = self.data
+    agents, data._hash, data._agentKeys, \
+      data.food, data._numFood, data._foodList, data.capsules, \
+      data._eaten, data.score, data.scoreChange, \
+      data._foodEaten, data._capsuleEaten, data._agentMoved = self._undoStack.pop()
+    for agentState, (configuration, scaredTimer) in zip( data.agentStates, agents ):
+      agentState.configuration = configuration
+      agentState.scaredTimer = scaredTimer
+    # applyMove refuses terminal states, so the state being restored wasn't one
+    data._win = False
+    data._lose = False
+
+  def getNumUndoMoves( self ):
+    """
+    Returns how many applyMove calls are waiting to be undone.
+    """
+    if self._undoStack is None: return 0
+    return len( self._undoStack )
+
+  def _applyAction( self, agentIndex, action ):
+    """
+    Applies the game rules for one move to this state's data.
+    """
     # Let agent's logic deal with its action's effects on the board
     if agentIndex == 0:  # Pacman is moving
-      state.data._eaten = [False for i in range(state.getNumAgents())]
-      PacmanRules.applyAction( state, action )
+      self.data._eaten = [False for i in range(self.getNumAgents())]
+      PacmanRules.applyAction( self, action )
     else:                # A ghost is moving
-      GhostRules.applyAction( state, action, agentIndex )
+      GhostRules.applyAction( self, action, agentIndex )
 
     # Time passes
     if agentIndex == 0:
-      state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
+      self.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
     else:
-      GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+      GhostRules.decrementTimer( self.data.agentStates[agentIndex] )
 
     # Resolve multi-agent effects
-    GhostRules.checkDeath( state, agentIndex )
+    GhostRules.checkDeath( self, agentIndex )
 
     # Book keeping
-    state.data._agentMoved = agentIndex
-    state.data.score += state.data.scoreChange
-    return state
+    self.data._agentMoved = agentIndex
+    self.data.score += self.data.scoreChange
+
+    # Rehash the agents that may have changed: the mover, plus every ghost
+    # when a capsule scares them and any ghost Pacman just ate
+    if agentIndex == 0 and (self.data._capsuleEaten != None or True in self.data._eaten):
+      self.data.updateAgentKeys( range( self.getNumAgents() ) )
+    else:
+      self.data.updateAgentKeys( (agentIndex,) )
 
   def getLegalPacmanActions( self ):
     return self.getLegalActions( 0 )
@@ -136,6 +203,15 @@ class GameState:
   def getGhostPositions(self):
     return [s.getPosition() for s in self.getGhostStates()]
 
+  def getAgentPosition( self, agentIndex ):
+    return self.data.agentStates[agentIndex].getPosition()
+
+  def getAgentDirection( self, agentIndex ):
+    return self.data.agentStates[agentIndex].getDirection()
+
+  def getScaredTimer( self, agentIndex ):
+    return self.data.agentStates[agentIndex].scaredTimer
+
   def getNumAgents( self ):
     return len( self.data.agentStates )
 
@@ -149,7 +225,22 @@ class GameState:
     return self.data.capsules
 
   def getNumFood( self ):
-    return self.data.food.count()
+    return self.data._numFood
+
+  def getFoodList( self ):
+    """
+    Returns a tuple of the (x,y) positions that still hold food.  It is kept
+    up to date as food is eaten, so this is cheaper than getFood().asList().
+    """
+    return self.data._foodList
+
+  def getMazeDistance( self, p, q ):
+    """
+    Returns the length of the shortest path from p to q around the walls
+    (see Layout.getMazeDistance).  After the first call on a layout this
+    is a table lookup.
+    """
+    return self.data.layout.getMazeDistance(p, q)
 
   def getFood(self):
     """
@@ -192,6 +283,8 @@ class GameState:
   # You shouldn't need to call these directly #
   #############################################
 
+  _undoStack = None # Created by the first applyMove
+
   def __init__( self, prevState = None ):
     """
     Generates a new state by copying information from its predecessor.
@@ -201,6 +294,14 @@ class GameState:
     else:
       self.data = GameStateData()
 
+  def copy( self ):
+    """
+    Returns a copy that shares the layout and food grid with this state
+    (both are only ever replaced, never changed in place, by the rules).
+    Much cheaper than deepCopy; used for observations in Game.runFast.
+    """
+    return GameState( self )
+
   def deepCopy( self ):
     state = GameState( self )
     state.data = self.data.deepCopy()
@@ -220,6 +321,50 @@ class GameState:
     """
     return hash( self.data )
 
+  def getKey( self ):
+    """
+    Returns a hashable key for this state: its Zobrist hash and score.  Unlike
+    the state itself, the key stays valid if the state is later changed in
+    place with applyMove, so search code can store it in tables.  Different
+    states share a key only with negligible (2^-64) probability.
+    """
+    return (self.data._hash, self.data.score)
+
+  def pack( self ):
+    """
+    Returns a compact, picklable tuple holding everything about this state
+    that changes during a game; the layout is left out.  GameState.unpack
+    rebuilds the state from it.  Use it to ship states between processes.
+    """
+    data = self.data
+    agents = tuple([(s.configuration.pos, s.configuration.direction, s.scaredTimer) for s in data.agentStates])
+    food = data.food
+    if not isinstance(food, BitGrid): food = BitGrid.fromGrid(food)
+    return (agents, food.bits, tuple(data.capsules), data.score, tuple(data._eaten), data._win, data._lose)
+
+  def unpack( layout, packed ):
+    """
+    Rebuilds a state on layout from the tuple returned by pack().
+    """
+    agents, foodBits, capsules, score, eaten, win, lose = packed
+    state = GameState()
+    state.initialize( layout, len( agents ) - 1 )
+    data = state.data
+    for agentState, (pos, direction, scaredTimer) in zip( data.agentStates, agents ):
+      agentState.configuration = Configuration( pos, direction )
+      agentState.scaredTimer = scaredTimer
+    data.food.bits = foodBits
+    data._numFood = data.food.count()
+    data._foodList = tuple( data.food.asList() )
+    data.capsules = list( capsules )
+    data.score = score
+    data._eaten = list( eaten )
+    data._win = win
+    data._lose = lose
+    data.rehash()
+    return state
+  unpack = staticmethod( unpack )
+
   def __str__( self ):
 
     return str(self.data)
@@ -306,12 +451,15 @@ class PacmanRules:
 
   def getLegalActions( state ):
     """
-    Returns a list of possible actions.
+    Returns a tuple of possible actions, looked up in the layout's
+    LegalMoveTable.
     """
-    possibleActions = Actions.getPossibleActions( state.getPacmanState().configuration, state.data.layout.walls )
-    if Directions.STOP in possibleActions:
-      possibleActions.remove( Directions.STOP )
-    return possibleActions
+    conf = state.data.agentStates[0].configuration
+    possibleActions = state.data.layout.getLegalMoveTable().pacman.get( conf.pos )
+    if possibleActions is not None:
+      return possibleActions
+    possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
+    return tuple( [action for action in possibleActions if action != Directions.STOP] )
   getLegalActions = staticmethod( getLegalActions )
 
   def applyAction( state, action ):
@@ -341,17 +489,15 @@ class PacmanRules:
     # Eat food
     if state.data.food[x][y]:
       state.data.scoreChange += 10
-      state.data.food = state.data.food.copy()
-      state.data.food[x][y] = False
+      state.data.removeFood( position )
       state.data._foodEaten = position
-      # TODO: cache numFood?
       numFood = state.getNumFood()
       if numFood == 0 and not state.data._lose:
         state.data.scoreChange += 500
         state.data._win = True
     # Eat capsule
     if( position in state.getCapsules() ):
-      state.data.capsules.remove( position )
+      state.data.removeCapsule( position )
       state.data._capsuleEaten = position
       # Reset all ghosts' scared timers
       for index in range( 1, len( state.data.agentStates ) ):
@@ -367,15 +513,20 @@ class GhostRules:
     """
     Ghosts cannot stop, and cannot turn around unless they
     reach a dead end, but can turn 90 degrees at intersections.
+    Returns a tuple, looked up in the layout's LegalMoveTable unless the
+    ghost is between cells.
     """
-    conf = state.getGhostState( ghostIndex ).configuration
+    conf = state.data.agentStates[ghostIndex].configuration
+    byDirection = state.data.layout.getLegalMoveTable().ghost.get( conf.pos )
+    if byDirection is not None:
+      return byDirection[conf.direction]
     possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
     reverse = Actions.reverseDirection( conf.direction )
     if Directions.STOP in possibleActions:
       possibleActions.remove( Directions.STOP )
     if reverse in possibleActions and len( possibleActions ) > 1:
       possibleActions.remove( reverse )
-    return possibleActions
+    return tuple( possibleActions )
   getLegalActions = staticmethod( getLegalActions )
 
   def applyAction( state, action, ghostIndex):
@@ -394,7 +545,9 @@ class GhostRules:
   def decrementTimer( ghostState):
     timer = ghostState.scaredTimer
     if timer == 1:
-      ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
+      # Build a new configuration: the old one may be shared with other states
+      configuration = ghostState.configuration
+      ghostState.configuration = Configuration( nearestPoint( configuration.pos ), configuration.direction )
     ghostState.scaredTimer = max( 0, timer - 1 )
   decrementTimer = staticmethod( decrementTimer )
 
@@ -419,6 +572,7 @@ class GhostRules:
       GhostRules.placeGhost(state, ghostState)
       ghostState.scaredTimer = 0
       # Added for first-person
+      state.data._eaten = state.data._eaten[:] # The list may be shared with the previous state
       state.data._eaten[agentIndex] = True
     else:
       if not state.data._win:
@@ -501,8 +655,14 @@ def readCommand( argv ):
                     help=default('Time to delay between frames; <0 means keyboard'), default=0.1)
   parser.add_option('-c', '--catchExceptions', action='store_true', dest='catchExceptions', 
                     help='Turns on exception handling and timeouts during games', default=False)
-  parser.add_option('--timeout', dest='timeout', type='int',
+  parser.add_option('--timeout', dest='timeout', type='float',
                     help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+  parser.add_option('--fast', action='store_true', dest='fast',
+                    help='Play without graphics on the headless game loop (Game.runFast)', default=False)
+  parser.add_option('--workers', dest='workers', type='int',
+                    help=default('Number of processes to play the games on (more than 1 plays without graphics)'), default=1)
+  parser.add_option('--seed', dest='seed', type='int',
+                    help='Plays game i from random seed SEED + i', metavar='SEED', default=None)
 
   options, otherjunk = parser.parse_args(argv)
   if len(otherjunk) != 0:
@@ -536,7 +696,7 @@ def readCommand( argv ):
   args['ghosts'] = [ghostType( i+1 ) for i in range( options.numGhosts )]
 
   # Choose a display format
-  if options.quietGraphics:
+  if options.quietGraphics or options.fast:
       import textDisplay
       args['display'] = textDisplay.NullGraphics()
   elif options.textGraphics:
@@ -550,6 +710,9 @@ def readCommand( argv ):
   args['record'] = options.record
   args['catchExceptions'] = options.catchExceptions
   args['timeout'] = options.timeout
+  args['workers'] = options.workers
+  args['seed'] = options.seed
+  args['fast'] = options.fast
 
   # Special case: recorded games don't use the runGames method or args structure
   if options.gameToReplay != None:
@@ -606,7 +769,20 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30, workers=1, seed=None, callback=None, fast=False ):
+  """
+  Plays numGames games and prints a summary of the results.
+
+  With workers > 1 the games are shared out over that many processes (see
+  batchGames.py) and a list of GameRecords, in game order, is returned
+  instead of the Game objects.  Game i is played from random seed seed + i
+  with fresh copies of the agents; callback, if given, is called with each
+  GameRecord as soon as its game is over.  With fast (always the case for
+  workers) the games are played by the headless Game.runFast loop.
+  """
+  if workers > 1:
+    return runGamesParallel(layout, pacman, ghosts, numGames, record, numTraining, catchExceptions, timeout, workers, seed, callback)
+
   import __main__
   __main__.__dict__['_display'] = display
 
@@ -623,29 +799,73 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
     else:
         gameDisplay = display
         rules.quiet = False
+    if seed is not None: random.seed(seed + i)
     game = rules.newGame(layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
-    game.run()
+    if fast: game.runFast()
+    else: game.run()
     if not beQuiet: games.append(game)
+    if callback is not None: callback(game)
 
     if record:
-      import time, pickle
-      fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-      f = file(fname, 'w')
-      components = {'layout': layout, 'actions': game.moveHistory}
-      pickle.dump(components, f)
-      f.close()
+      recordGame(layout, game.moveHistory, i)
 
   if (numGames-numTraining) > 0:
-    scores = [game.state.getScore() for game in games]
-    wins = [game.state.isWin() for game in games]
-    winRate = wins.count(True)/ float(len(wins))
-    print('Average Score:', sum(scores) / float(len(scores)))
-    print('Scores:       ', ', '.join([str(score) for score in scores]))
-    print('Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate))
-    print('Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins]))
+    printSummary([game.state.getScore() for game in games], [game.state.isWin() for game in games],
+                 mergeMoveTimes(games))
 
   return games
 
+def runGamesParallel( layout, pacman, ghosts, numGames, record, numTraining, catchExceptions, timeout, workers, seed, callback ):
+  import batchGames
+  if numTraining > 0:
+    raise Exception('Training games need a single worker (every parallel game starts from a fresh agent)')
+  if seed is None: seed = random.randrange(2 ** 31)
+
+  records = []
+  for gameRecord in batchGames.runBatch(layout, pacman, ghosts, numGames, workers, seed, catchExceptions, timeout):
+    if gameRecord.win: print("Pacman emerges victorious! Score: %d" % gameRecord.score)
+    elif not gameRecord.agentCrashed: print("Pacman died! Score: %d" % gameRecord.score)
+    records.append(gameRecord)
+    if callback is not None: callback(gameRecord)
+    if record:
+      recordGame(layout, gameRecord.moveHistory, gameRecord.index)
+
+  records.sort(key=lambda gameRecord: gameRecord.index)
+  if numGames > 0:
+    printSummary([r.score for r in records], [r.win for r in records], mergeMoveTimes(records))
+  return records
+
+def recordGame( layout, actions, i ):
+  import pickle
+  fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
+  f = open(fname, 'wb')
+  components = {'layout': layout, 'actions': actions}
+  pickle.dump(components, f)
+  f.close()
+
+def mergeMoveTimes( games ):
+  """
+  Returns one util.LatencyHistogram per agent holding the move times of all
+  the games (Games or GameRecords).
+  """
+  merged = []
+  for game in games:
+    for i, histogram in enumerate(game.moveTimes):
+      if i == len(merged): merged.append(util.LatencyHistogram())
+      merged[i].merge(histogram)
+  return merged
+
+def printSummary( scores, wins, moveTimes=None ):
+  winRate = wins.count(True)/ float(len(wins))
+  print('Average Score:', sum(scores) / float(len(scores)))
+  print('Scores:       ', ', '.join([str(score) for score in scores]))
+  print('Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate))
+  print('Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins]))
+  if moveTimes:
+    for i, histogram in enumerate(moveTimes):
+      label = 'Pacman' if i == 0 else 'Ghost %d' % i
+      print('%-15s%-9s%s' % ('Move times:' if i == 0 else '', label, histogram))
+
 if __name__ == '__main__':
   """
   The main function called when pacman.py is run
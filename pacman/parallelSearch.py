@@ -0,0 +1,79 @@
+"""
+parallelSearch.py holds the process pool that the search agents in
+submission.py use to split a search across cores (see
+MultiAgentSearchAgent.parallelSearch).
+
+Work is shipped to the workers in a compact form: the agent is pickled
+without its tables, the layout as its text and each state as the tuple
+returned by GameState.pack().  Workers keep the agents and layouts they have
+already seen, so the pool stays warm from one move to the next.
+"""
+import atexit
+import multiprocessing
+import pickle
+
+_pool = None
+_poolSize = 0
+
+def getPool(workers):
+  "Returns the shared pool, (re)starting it with the given number of workers."
+  global _pool, _poolSize
+  if _pool is None or _poolSize != workers:
+    closePool()
+    _pool = multiprocessing.Pool(workers)
+    _poolSize = workers
+  return _pool
+
+def closePool():
+  global _pool, _poolSize
+  if _pool is not None:
+    _pool.terminate()
+    _pool.join()
+  _pool = None
+  _poolSize = 0
+
+atexit.register(closePool)
+
+def search(agent, layout, depth, subtrees, workers):
+  """
+  Returns the values of the (packed state, agent index) subtrees, each
+  searched to depth by a copy of agent in the pool.
+  """
+  if not subtrees: return []
+  agentBlob = pickle.dumps(agent)
+  layoutText = tuple(layout.layoutText)
+  tasks = [(agentBlob, layoutText, packed, agentIndex, depth) for packed, agentIndex in subtrees]
+  return getPool(workers).map(searchTask, tasks, 1)
+
+# Worker side.  The caches are keyed by the shipped bytes and text, and
+# flushed when they grow, since agents change (e.g. depth) between runs.
+_agents = {}
+_layouts = {}
+CACHE_SIZE = 16
+
+def _cached(cache, key, build):
+  value = cache.get(key)
+  if value is None:
+    if len(cache) >= CACHE_SIZE: cache.clear()
+    value = cache[key] = build(key)
+  return value
+
+def _loadAgent(agentBlob):
+  agent = pickle.loads(agentBlob)
+  agent.parallel = 0 # Workers search serially
+  return agent
+
+def _loadLayout(layoutText):
+  import layout
+  return layout.getSharedLayout(list(layoutText))
+
+def searchTask(task):
+  "Searches one subtree in a worker and returns its value."
+  from pacman import GameState
+  agentBlob, layoutText, packed, agentIndex, depth = task
+  agent = _cached(_agents, agentBlob, _loadAgent)
+  state = agent.searchState(GameState.unpack(_cached(_layouts, layoutText, _loadLayout), packed))
+  agent.newSearch()
+  agent.searchDepth = depth
+  agent.ply = 0
+  return agent.searchNode(state, agentIndex, depth)[0]
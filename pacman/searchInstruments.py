@@ -0,0 +1,145 @@
+"""
+searchInstruments.py counts what the search agents in submission.py do, to
+tell why a move was slow: a big branching factor, too little pruning or a
+costly evaluation function.  Agents collect the counts when created with
+instrument=True (e.g. -a instrument=True):
+
+  agent.getMoveStats()       - the counts of the last move
+  agent.getGameStats()       - the totals of the game so far, with every move's counts under 'moves'
+  mergeStats(gameStatsList)  - the totals of several games, e.g. an experiment cell
+
+The counts are plain dicts, lists and numbers, ready for json.dumps:
+
+  searches             root searches (one per iterative-deepening iteration)
+  nodes                nodes generated, the roots included
+  nodesPerPly          nodes generated at each distance from the root
+  nodesPerAgent        moves generated for each agent (Pacman's layers first);
+                       children generated only to order the moves aren't nodes
+  cutoffs              alpha-beta (and Star1) cutoffs
+  leafEvaluations      evaluation function calls that scored a leaf
+  orderingEvaluations  ... that scored a child for move ordering
+  successorSeconds     time spent generating (and undoing) moves, ordering probes included
+  evaluationSeconds    time spent in the evaluation function
+  searchSeconds        time the searches took in all
+  depth                the depth of the last completed search (per move only)
+
+Subtrees that parallelSearch hands to worker processes are not counted.
+"""
+import time
+
+COUNTERS = ['searches', 'nodes', 'cutoffs', 'leafEvaluations', 'orderingEvaluations',
+            'successorSeconds', 'evaluationSeconds', 'searchSeconds']
+LISTS = ['nodesPerPly', 'nodesPerAgent']
+
+class SearchInstruments:
+  """
+  The counters of one agent.  The search calls countRoot, countNode,
+  countCutoff and countOrdering as it goes; TimedEvaluation counts the
+  evaluations.  startMove and finishMove bracket each move.
+  """
+  def __init__(self):
+    self.moves = []
+    self.startMove()
+
+  def startMove(self):
+    self.searches = 0
+    self.cutoffs = 0
+    self.evaluations = 0
+    self.orderingEvaluations = 0
+    self.successorSeconds = 0.0
+    self.evaluationSeconds = 0.0
+    self.nodesPerPly = []
+    self.nodesPerAgent = []
+    self.startTime = time.perf_counter()
+
+  def finishMove(self, depth):
+    "Records the counts of the move that just finished."
+    self.moves.append({'searches': self.searches,
+                       'nodes': sum(self.nodesPerPly),
+                       'nodesPerPly': self.nodesPerPly,
+                       'nodesPerAgent': self.nodesPerAgent,
+                       'cutoffs': self.cutoffs,
+                       'leafEvaluations': self.evaluations - self.orderingEvaluations,
+                       'orderingEvaluations': self.orderingEvaluations,
+                       'successorSeconds': self.successorSeconds,
+                       'evaluationSeconds': self.evaluationSeconds,
+                       'searchSeconds': time.perf_counter() - self.startTime,
+                       'depth': depth})
+
+  def newGame(self):
+    self.moves = []
+
+  def countRoot(self):
+    self.searches += 1
+    self._add(self.nodesPerPly, 0, 1)
+
+  def countNode(self, ply, agent, seconds):
+    "Counts a node generated at ply by agent's move, which took seconds."
+    self._add(self.nodesPerPly, ply, 1)
+    self._add(self.nodesPerAgent, agent, 1)
+    self.successorSeconds += seconds
+
+  def countCutoff(self):
+    self.cutoffs += 1
+
+  def countOrdering(self):
+    "Marks the next evaluation as scoring a child for move ordering rather than a leaf."
+    self.orderingEvaluations += 1
+
+  def _add(self, counts, index, n):
+    if index >= len(counts):
+      counts.extend([0] * (index + 1 - len(counts)))
+    counts[index] += n
+
+  def getMoveStats(self):
+    if not self.moves: return None
+    return self.moves[-1]
+
+  def getGameStats(self):
+    stats = mergeStats(self.moves)
+    stats['moves'] = list(self.moves)
+    return stats
+
+  def __getstate__(self):
+    # Copies shipped to worker processes start with empty counts
+    return {'moves': []}
+
+  def __setstate__(self, state):
+    self.__init__()
+
+class TimedEvaluation:
+  """
+  Wraps an evaluation function (one state in, a score out), or with batch a
+  batch evaluation function (a list of states in, their scores out), to
+  count and time its calls in instruments.
+  """
+  def __init__(self, function, instruments, batch = False):
+    self.function = function
+    self.instruments = instruments
+    self.batch = batch
+
+  def __call__(self, states):
+    start = time.perf_counter()
+    result = self.function(states)
+    self.instruments.evaluationSeconds += time.perf_counter() - start
+    self.instruments.evaluations += len(states) if self.batch else 1
+    return result
+
+def mergeStats(statsList):
+  """
+  Adds up move or game counts: counters are summed, lists element by
+  element, and numMoves says how many moves went in.
+  """
+  merged = dict([(name, 0) for name in COUNTERS])
+  for name in LISTS: merged[name] = []
+  merged['numMoves'] = 0
+  for stats in statsList:
+    for name in COUNTERS:
+      merged[name] += stats[name]
+    for name in LISTS:
+      counts = merged[name]
+      for i, n in enumerate(stats[name]):
+        if i == len(counts): counts.append(0)
+        counts[i] += n
+    merged['numMoves'] += stats.get('numMoves', 1)
+  return merged
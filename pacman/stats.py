@@ -8,6 +8,7 @@ def mergeCsv():
     layoutRes = []
 
     for filename in os.listdir(results):
+        if not filename.startswith('results_'): continue  # e.g. latency_<layout>.csv has other columns
 
         layoutRes.append(results + filename)
 
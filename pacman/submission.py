@@ -2,7 +2,16 @@ import random
 import util
 from game import Agent
 from game import Actions
+import gc
 import math
+import time
+import featureExtractors
+import cellState
+import searchInstruments
+
+EXACT = util.TranspositionTable.EXACT
+LOWER = util.TranspositionTable.LOWER
+UPPER = util.TranspositionTable.UPPER
 
 #     ********* Original Reflex agent- section h *********
 class OriginalReflexAgent(Agent):
@@ -91,7 +100,7 @@ def scoreEvaluationFunction(gameState):
 
 
 # b: implementing a better heuristic function
-def betterEvaluationFunction(gameState):
+def betterEvaluationFunction(gameState, distance = util.manhattanDistance):
   """
 
   The betterEvaluationFunction takes in a GameState (pacman.py) and should return a number, where higher numbers are better.
@@ -106,6 +115,8 @@ def betterEvaluationFunction(gameState):
   gameState.getNumAgents():
   gameState.getScore():
   The GameState class is defined in pacman.py and you might want to look into that for other helper methods.
+
+  distance measures how far pacman is from food and ghosts (see mazeEvaluationFunction).
   """
 
   #if gameState.isWin():
@@ -114,7 +125,7 @@ def betterEvaluationFunction(gameState):
       return -10000
 
   pos = gameState.getPacmanPosition()
-  minDistFood = getMinDistFood(gameState, pos)
+  minDistFood = getMinDistFood(gameState, pos, distance)
   #print(getMinDistFood(gameState))
 
   # the smaller minDistFood, the better
@@ -129,11 +140,11 @@ def betterEvaluationFunction(gameState):
           badGhosts.append(ghost)
 
 
-  minDistBadGhost = getMinDistGhost(pos,badGhosts)
+  minDistBadGhost = getMinDistGhost(pos,badGhosts,distance)
   if minDistBadGhost > 0:
        score -= 1/minDistBadGhost # we like bad ghosts as far as possible
 
-  minDistGoodGhost = getMinDistGhost(pos,goodGhosts)
+  minDistGoodGhost = getMinDistGhost(pos,goodGhosts,distance)
   if minDistGoodGhost > 0:
       score += 1/minDistGoodGhost # the closer good ghost is the better
 
@@ -146,25 +157,51 @@ def betterEvaluationFunction(gameState):
   return score
 
 
-def getMinDistGhost(pos,Ghosts):
+def mazeEvaluationFunction(gameState):
+  """
+    The betterEvaluationFunction, measuring distances along the maze
+    (gameState.getMazeDistance) instead of as the crow flies, so walls
+    between pacman and a ghost or food are taken into account.
+  """
+  return betterEvaluationFunction(gameState, gameState.getMazeDistance)
+
+
+def vectorizedEvaluationFunction(gameState):
+  """
+    The betterEvaluationFunction computed with NumPy by featureExtractors.py
+    (exactly the same values).  It is only faster in batches:
+    featureExtractors.betterEvaluationBatch scores many states in one call.
+  """
+  return featureExtractors.betterEvaluation(gameState)
+
+
+def betterEvaluationBatch(gameStates):
+  """
+    betterEvaluationFunction for a list of states at once (see
+    featureExtractors.py), for the search agents' batchEvalFn argument.
+  """
+  return featureExtractors.betterEvaluationBatch(gameStates)
+
+
+def getMinDistGhost(pos,Ghosts,distance = util.manhattanDistance):
 
     ghostsPositions = [g.getPosition() for g in Ghosts]
     if ghostsPositions:
-        return min(map(lambda x: util.manhattanDistance(pos, x), ghostsPositions))
+        return min(map(lambda x: distance(pos, x), ghostsPositions))
     else:
         return 0
 
 
-def getMinDistFood(gameState, pos):
+def getMinDistFood(gameState, pos, distance = util.manhattanDistance):
     """
     gameState: GameState object of current state inspected
+    distance : the distance function to measure with
     return   : the minimal distance to food from current pacman location
     """
-    foodGrid = gameState.getFood()
-    foodList = foodGrid.asList()
+    foodList = gameState.getFoodList()
 
     if len(foodList)> 0 :
-        minDistFood = min(map(lambda x: util.manhattanDistance(pos, x), foodList))
+        minDistFood = min(map(lambda x: distance(pos, x), foodList))
     else:
         return 1
     return minDistFood
@@ -183,12 +220,520 @@ class MultiAgentSearchAgent(Agent):
     Note: this is an abstract class: one that should not be instantiated.  It's
     only partially specified, and designed to be extended.  Agent (game.py)
     is another abstract class.
+
+    With a time limit, a pass of Python's cycle collector over a large
+    transposition table (tt or reuse) can take tens of milliseconds, and
+    push a move that was about to finish past its limit.  holdGC=True
+    switches the collector off while a timed search runs and back on once
+    the move is chosen.  This is off by default because it affects the
+    whole process: no cycles are collected for the length of the move, in
+    other threads or by the code running the agent either, and the
+    collection put off lands after the move.
   """
 
-  def __init__(self, evalFn = 'betterEvaluationFunction', depth = '2'):
+  def __init__(self, evalFn = 'betterEvaluationFunction', depth = '2', inPlace = 'False',
+               tt = 'False', ttSize = '65536', timeLimit = '0', maxDepth = '100', parallel = '0',
+               batchEvalFn = '', reuse = 'False', cells = 'False', instrument = 'False',
+               holdGC = 'False'):
     self.index = 0 # Pacman is always agent index 0
     self.evaluationFunction = util.lookup(evalFn, globals())
     self.depth = int(depth)
+    # In-place mode walks a single working state with applyMove/undoMove
+    # instead of allocating a GameState per node.
+    self.inPlace = isTrue(inPlace)
+    # Positions that recur within a search are looked up instead of searched again.
+    # The table may be replaced by one shared with other agents.
+    self.transpositionTable = None
+    if isTrue(tt):
+      self.transpositionTable = util.TranspositionTable(int(ttSize))
+    # With a time limit (seconds per move) the agent deepens iteratively
+    # up to maxDepth instead of searching to a fixed depth.
+    self.timeLimit = float(timeLimit)
+    self.maxDepth = int(maxDepth)
+    self.deadline = None
+    self.searchDepth = self.depth # Depth of the search in progress
+    self.rootAction = None # Best root action of the previous iteration
+    self.completedDepth = 0
+    self.ply = 0 # Number of moves between the root and the node being searched
+    # With parallel > 1, fixed-depth searches are split across that many processes
+    self.parallel = int(parallel)
+    # With a batch evaluation function (many states in, a list of scores out)
+    # the last round of the search is expanded and evaluated in one batch.
+    # It must give the same values as evalFn.
+    self.batchEvaluationFunction = None
+    if batchEvalFn:
+      self.batchEvaluationFunction = util.lookup(batchEvalFn, globals())
+    # With reuse the results of the previous move's search are kept (in the
+    # transposition table, which reuse turns on) and the next search picks
+    # up from the subtree the game actually went down.
+    self.reuse = isTrue(reuse)
+    if self.reuse and self.transpositionTable is None:
+      self.transpositionTable = util.TranspositionTable(int(ttSize))
+    self.lastRoot = None # Root state and result of the previous search, when reusing
+    self.lastResult = None
+    # With cells the search runs on cellState.CellState, which packs a state
+    # into a tuple of small ints; evaluation functions with a version for it
+    # (cellState.CELL_EVALUATIONS) are swapped for that version.
+    self.cells = isTrue(cells)
+    if self.cells:
+      if self.batchEvaluationFunction is not None:
+        raise Exception('cells=True and batchEvalFn can\'t be used together: batch evaluation needs GameStates')
+      self.evaluationFunction = cellState.CELL_EVALUATIONS.get(evalFn, self.evaluationFunction)
+    # With instrument the searches count their nodes, cutoffs and evaluations
+    # and time move generation and evaluation (see searchInstruments.py).
+    self.instruments = None
+    if isTrue(instrument):
+      self.instruments = searchInstruments.SearchInstruments()
+      self.evaluationFunction = searchInstruments.TimedEvaluation(self.evaluationFunction, self.instruments)
+      if self.batchEvaluationFunction is not None:
+        self.batchEvaluationFunction = searchInstruments.TimedEvaluation(self.batchEvaluationFunction, self.instruments, True)
+    # With holdGC timed searches run with the cycle collector off (see above)
+    self.holdGC = isTrue(holdGC)
+
+  def registerInitialState(self, gameState):
+    """
+      Called by the game before its first move.
+    """
+    if self.instruments is not None:
+      self.instruments.newGame()
+
+  def getMoveStats(self):
+    """
+      Returns the instrumentation counts of the last move (see
+      searchInstruments.py), or None without instrument=True.
+    """
+    if self.instruments is None: return None
+    return self.instruments.getMoveStats()
+
+  def getGameStats(self):
+    """
+      Returns the instrumentation counts of the game so far, with each
+      move's under 'moves', or None without instrument=True.
+    """
+    if self.instruments is None: return None
+    return self.instruments.getGameStats()
+
+  def newSearch(self):
+    """
+      Called at the start of every getAction.
+    """
+    if self.transpositionTable is not None:
+      self.transpositionTable.newSearch()
+
+  def runSearch(self, gameState, depth = None):
+    """
+      Runs self.search(gameState, depth), which returns [value, action] for
+      the root, and returns its result.  Without a time limit this is a single search to
+      depth (self.depth by default).  With one, the depth is increased one
+      step at a time until the time (counted from the start of the move)
+      runs out, and the result of the deepest
+      completed iteration is returned; each iteration tries the previous
+      one's best action first.  The first iteration always runs to completion
+      so that there is a move to return.
+
+      With reuse, a search that follows on from the previous one (see
+      followGame) starts from what that search left: its table entries, and
+      whatever reuseSearch carries over.  After a depth-1 iteration, iterative
+      deepening then jumps to one round short of the depth the previous move
+      completed, which the table mostly answers straight away.
+    """
+    self.newSearch()
+    self.ply = 0
+    if self.instruments is not None:
+      self.instruments.startMove()
+    if self.parallel <= 1 or self.timeLimit > 0:
+      gameState = self.searchState(gameState)
+    line = self.followGame(gameState) if self.reuse else None
+    if line is not None:
+      self.reuseSearch(line)
+    if self.timeLimit <= 0:
+      self.searchDepth = self.depth if depth is None else depth
+      if self.parallel > 1:
+        return self.finishSearch(gameState, self.parallelSearch(gameState, self.searchDepth))
+      return self.finishSearch(gameState, self.search(gameState, self.searchDepth))
+
+    start = time.time()
+    mark = gameState.getNumUndoMoves()
+    best = None
+    self.rootAction = None
+    depths = list(range(1, self.maxDepth + 1))
+    if line is not None and self.completedDepth > 2:
+      # Only depth 1 runs without a deadline; the reused depth runs under it,
+      # and the depth-1 result stands if it can't finish
+      depths = [1] + list(range(min(self.completedDepth - 1, self.maxDepth), self.maxDepth + 1))
+    # With holdGC the collection waits until the move is chosen and recorded
+    collecting = self.holdGC and gc.isenabled()
+    if collecting: gc.disable()
+    try:
+      for depth in depths:
+        self.searchDepth = depth
+        try:
+          result = self.search(gameState, depth)
+        except SearchTimeout:
+          # Take back the moves the aborted iteration left applied
+          while gameState.getNumUndoMoves() > mark:
+            gameState.undoMove()
+          self.ply = 0
+          break
+        best = result
+        self.completedDepth = depth
+        self.rootAction = result[1]
+        if self.deadline is None:
+          # The budget counts from the start of the move, the time this
+          # uncancellable iteration took included
+          self.deadline = start + self.timeLimit
+        if time.time() >= self.deadline:
+          break
+      self.deadline = None
+      return self.finishSearch(gameState, best)
+    finally:
+      self.deadline = None
+      self.rootAction = None
+      if collecting: gc.enable()
+
+  def finishSearch(self, gameState, result):
+    """
+      Remembers the root and result of a search, for reuse, and returns the
+      result.
+    """
+    if self.instruments is not None:
+      self.instruments.finishMove(self.searchDepth if self.timeLimit <= 0 else self.completedDepth)
+    if self.reuse:
+      self.lastRoot = gameState.copy()
+      self.lastResult = result
+    return result
+
+  def searchState(self, gameState):
+    """
+      Returns the state to search from gameState: a cellState.CellState
+      with cells, else gameState itself.
+    """
+    if self.cells:
+      return cellState.CellState.fromGameState(gameState)
+    return gameState
+
+  def followGame(self, gameState):
+    """
+      Returns the moves played since the root of the previous search, one
+      per agent starting with Pacman's, if gameState is what they lead to.
+      Returns None when it isn't (e.g. a new game), or there was no
+      previous search.  The ghosts' moves are read off their new
+      configurations.
+    """
+    if self.lastRoot is None or not self.lastResult or self.lastResult[1] in (None, []):
+      return None
+    state = self.lastRoot
+    line = []
+    for agent in range(gameState.getNumAgents()):
+      if state.isWin() or state.isLose():
+        return None
+      actions = [self.lastResult[1]] if agent == 0 else state.getLegalActions(agent)
+      observed = (gameState.getAgentPosition(agent), gameState.getAgentDirection(agent))
+      for action in actions:
+        child = state.generateSuccessor(agent, action)
+        if agent == 0 or (child.getAgentPosition(agent), child.getAgentDirection(agent)) == observed:
+          break
+      else:
+        return None
+      state = child
+      line.append(action)
+    if state.getKey() != gameState.getKey():
+      return None
+    return line
+
+  def reuseSearch(self, line):
+    """
+      Called before a search that follows on from the previous one, with
+      the moves played since (see followGame).  The table entries are
+      reused as they are; agents with other state to carry over (e.g. a
+      principal variation) override this.
+    """
+    pass
+
+  def search(self, gameState, depth):
+    """
+      Searches gameState to depth and returns [value, action].
+    """
+    if self.instruments is not None:
+      self.instruments.countRoot()
+    return self.searchNode(gameState, self.index, depth)
+
+  def searchNode(self, gameState, agent, depth):
+    """
+      Returns [value, action] for the node where agent is to move with depth
+      rounds left, searched with no bounds.  Implemented by each agent.
+    """
+    util.raiseNotDefined()
+
+  def isBatched(self, agent, depth):
+    """
+      Returns whether the node where agent is to move with depth rounds left
+      is searched by batchSearch.
+    """
+    return depth == 1 and agent == 0 and self.batchEvaluationFunction is not None
+
+  def batchSearch(self, gameState):
+    """
+      Searches the last round below gameState (Pacman to move, one round
+      left) breadth first: the whole subtree is expanded, all of its leaves
+      are scored with a single call to the batch evaluation function, and
+      the values are backed up with combineGhostValues and
+      combineRootValues.  Returns [value, action].
+    """
+    numAgents = gameState.getNumAgents()
+    leaves = []
+    instruments = self.instruments
+    def generate(state, agent, action):
+      if instruments is None:
+        return state.generateSuccessor(agent, action)
+      start = time.perf_counter()
+      child = state.generateSuccessor(agent, action)
+      instruments.countNode(self.ply + agent + 1, agent, time.perf_counter() - start)
+      return child
+    def expand(state, agent):
+      self.countNode(self.ply + agent)
+      if agent == numAgents or state.isWin() or state.isLose():
+        leaves.append(state)
+        return len(leaves) - 1
+      return (state, agent, [(action, expand(generate(state, agent, action), agent + 1))
+                             for action in state.getLegalActions(agent)])
+
+    root = [(action, expand(generate(gameState, 0, action), 1))
+            for action in self.getOrderedActions(gameState, 0, 1)]
+    values = [float(v) for v in self.batchEvaluationFunction(leaves)]
+    def backUp(node):
+      if isinstance(node, int): return values[node]
+      state, agent, children = node
+      return self.combineGhostValues(state, agent, dict([(action, backUp(child)) for action, child in children]))
+    return self.combineRootValues([(action, backUp(child), isinstance(child, int)) for action, child in root])
+
+  def countNode(self, ply):
+    """
+      Called for every node searched, with its distance from the root.
+    """
+    pass
+
+  def countCutoff(self):
+    """
+      Called for every alpha-beta (or Star1) cutoff.
+    """
+    if self.instruments is not None:
+      self.instruments.countCutoff()
+
+  def isLeaf(self, gameState, agent, depth):
+    """
+      Returns whether searchNode(gameState, agent, depth) would just evaluate
+      gameState.
+    """
+    if agent >= gameState.getNumAgents():
+      depth -= 1
+    return gameState.isWin() or gameState.isLose() or depth == 0
+
+  def getRootActions(self, gameState, depth):
+    """
+      Returns Pacman's actions in the order the serial search tries them at the root.
+    """
+    return self.getOrderedActions(gameState, self.index, depth)
+
+  def parallelSearch(self, gameState, depth):
+    """
+      Searches the subtrees below the root in a pool of self.parallel worker
+      processes, and combines their values the way the serial search would,
+      so the same action is chosen (transposition-table and history effects
+      aside).  The root is split on Pacman's actions, and also on the first
+      ghost's actions when Pacman has fewer actions than there are workers.
+      States are shipped with GameState.pack(); see parallelSearch.py.  A
+      won or lost root gets [evaluation, []], as in the serial search.
+    """
+    import parallelSearch
+    self.newWorkerSearch()
+    if self.isLeaf(gameState, self.index, depth):
+      # Nothing to split: a won or lost root is just evaluated
+      return self.search(self.searchState(gameState), depth)
+    actions = self.getRootActions(gameState, depth)
+    splitGhosts = len(actions) < self.parallel and gameState.getNumAgents() > 1
+
+    # Lay out the top of the tree; each subtree below it becomes a task unless it is a leaf
+    values = []
+    tasks = []
+    def subtree(state, agent):
+      if self.isLeaf(state, agent, depth):
+        values.append(self.searchNode(self.searchState(state), agent, depth)[0])
+      else:
+        values.append(None)
+        tasks.append((len(values) - 1, state.pack(), agent))
+      return len(values) - 1
+
+    root = []
+    for action in actions:
+      child = gameState.generateSuccessor(self.index, action)
+      if splitGhosts and not self.isLeaf(child, 1, depth):
+        ghostActions = child.getLegalActions(1)
+        root.append((action, child, [(a, subtree(child.generateSuccessor(1, a), 2)) for a in ghostActions]))
+      else:
+        root.append((action, child, subtree(child, 1)))
+
+    results = parallelSearch.search(self, gameState.data.layout, depth, [t[1:] for t in tasks], self.parallel)
+    for (index, packed, agent), value in zip(tasks, results):
+      values[index] = value
+
+    rootValues = []
+    for action, child, node in root:
+      if isinstance(node, list):
+        rootValues.append((action, self.combineGhostValues(child, 1, dict([(a, values[i]) for a, i in node])), False))
+      else:
+        rootValues.append((action, values[node], self.isLeaf(child, 1, depth)))
+    return self.combineRootValues(rootValues)
+
+  def newWorkerSearch(self):
+    """
+      Prepares a parallel search; the workers start from fresh tables.
+    """
+    self.newSearch()
+
+  def combineGhostValues(self, gameState, agent, values):
+    """
+      Returns the value of a ghost node from its children's values, given as
+      a dict from action to value.
+    """
+    return min([math.inf] + list(values.values()))
+
+  def combineRootValues(self, rootValues):
+    """
+      Picks the root result from (action, value, isLeaf) triples listed in the
+      order the serial search visits them.
+    """
+    cur_max_v = -math.inf
+    cur_action = []
+    for action, v, leaf in rootValues:
+      if v >= cur_max_v:
+        cur_max_v = v
+        cur_action = action
+    return [cur_max_v, cur_action]
+
+  def __getstate__(self):
+    """
+      Agents are pickled (e.g. to ship them to worker processes) without the
+      contents of their transposition table, which comes back empty, and
+      without what they keep from one move to the next.  An unchanged
+      agent then pickles the same way on every move, so the workers' agent
+      cache (see parallelSearch.py) finds it.  Subclasses drop their own
+      per-move and per-game state too.
+    """
+    state = self.__dict__.copy()
+    state['lastRoot'] = None
+    state['lastResult'] = None
+    state['completedDepth'] = 0
+    if self.transpositionTable is not None:
+      state['transpositionTable'] = None
+      state['_transpositionTableSize'] = self.transpositionTable.size
+    return state
+
+  def __setstate__(self, state):
+    size = state.pop('_transpositionTableSize', None)
+    self.__dict__.update(state)
+    if size is not None:
+      self.transpositionTable = util.TranspositionTable(size)
+
+  def checkTime(self):
+    """
+      Aborts the search in progress once the move's time budget is spent.
+    """
+    if self.deadline is not None and time.time() > self.deadline:
+      raise SearchTimeout()
+
+  def getOrderedActions(self, gameState, agent, depth, first = None):
+    """
+      Returns the legal actions of agent in the order they should be
+      searched: first (e.g. a stored best action) leads, except at the root
+      of an iterative-deepening search, where the previous iteration's best
+      action does.
+    """
+    actions = gameState.getLegalActions(agent)
+    if agent == 0 and depth == self.searchDepth and self.rootAction is not None:
+      first = self.rootAction
+    return self.orderActions(actions, first)
+
+  def probe(self, gameState, agent):
+    """
+      Returns (key, entry) for the transposition table, where entry is the
+      stored TranspositionEntry or None.  key is None when no table is used.
+    """
+    if self.transpositionTable is None:
+      return None, None
+    key = (gameState.getKey(), agent)
+    return key, self.transpositionTable.lookup(key)
+
+  def remember(self, key, depth, result, flag = EXACT, value = None):
+    """
+      Stores a search result [value, action] under key and returns it.  value
+      overrides result[0] when the node returns a cutoff marker rather than
+      the bound itself.
+    """
+    if key is not None:
+      if value is None: value = result[0]
+      self.transpositionTable.store(key, depth, value, flag, result[1])
+    return result
+
+  def orderActions(self, actions, first):
+    """
+      Returns actions with first (e.g. a stored best action) moved to the front.
+    """
+    if first is None or first not in actions:
+      return actions
+    return [first] + [a for a in actions if a != first]
+
+  def successor(self, gameState, agent, action, probe = False):
+    """
+      Returns the state reached when agent plays action.  In in-place mode this
+      is gameState itself, and the move must be taken back with restore().
+      A probe (e.g. a child looked at only to order the moves) isn't counted
+      as a node by the instruments; its time is.
+    """
+    self.ply += 1
+    instruments = self.instruments
+    if instruments is not None:
+      start = time.perf_counter()
+    if self.inPlace:
+      gameState.applyMove(agent, action)
+      child = gameState
+    else:
+      child = gameState.generateSuccessor(agent, action)
+    if instruments is not None:
+      if probe:
+        instruments.successorSeconds += time.perf_counter() - start
+      else:
+        instruments.countNode(self.ply, agent, time.perf_counter() - start)
+    return child
+
+  def restore(self, gameState):
+    """
+      Returns from the last successor() call, undoing its move when
+      searching in place.
+    """
+    self.ply -= 1
+    if self.inPlace:
+      if self.instruments is not None:
+        start = time.perf_counter()
+        gameState.undoMove()
+        self.instruments.successorSeconds += time.perf_counter() - start
+      else:
+        gameState.undoMove()
+
+
+class SearchTimeout(Exception):
+  """
+    Raised inside a search when its time budget runs out.
+  """
+  pass
+
+
+def isTrue(value):
+  """
+    Reads a boolean agent argument, which arrives as a string from -a
+    (or as 1 for a bare flag).
+  """
+  return str(value).lower() in ['1', 'true', 'yes', 'on']
 
 
 # c: implementing Minimax
@@ -230,86 +775,289 @@ class MinimaxAgent(MultiAgentSearchAgent):
       self.depth:
         The depth to which search should continue
     """
-    minimax = self.minimax(gameState, self.index, self.depth)
+    minimax = self.runSearch(gameState)
     return minimax[1]
 
+  def searchNode(self, gameState, agent, depth):
+    return self.minimax(gameState, agent, depth)
+
   def minimax(self, gameState, agent, depth):
     if agent >= gameState.getNumAgents():
         agent = 0
         depth -= 1
     if gameState.isWin() or gameState.isLose() or depth == 0:
         return [self.evaluationFunction(gameState), []]
+    self.checkTime()
+    if self.isBatched(agent, depth):
+        return self.batchSearch(gameState)
+
+    key, entry = self.probe(gameState, agent)
+    if entry is not None and entry.depth >= depth:
+        return [entry.value, entry.action]
 
     if agent == 0:
         cur_max_v = -math.inf
         cur_action = []
-        for action in gameState.getLegalActions(agent):
-            c = gameState.generateSuccessor(agent, action)
+        for action in self.getOrderedActions(gameState, agent, depth):
+            c = self.successor(gameState, agent, action)
             v = self.minimax(c, agent+1, depth)[0]
+            self.restore(gameState)
             if v >= cur_max_v:
                 cur_max_v = v
                 cur_action = action
-        return [cur_max_v, cur_action]
+        return self.remember(key, depth, [cur_max_v, cur_action])
 
     else:
         cur_min_v = math.inf
         cur_action = []
         for action in gameState.getLegalActions(agent):
-            c = gameState.generateSuccessor(agent, action)
+            c = self.successor(gameState, agent, action)
             v = self.minimax(c, agent+1, depth)[0]
+            self.restore(gameState)
             if v <= cur_min_v:
                 cur_min_v = v
                 cur_action = action
-        return [cur_min_v, cur_action]
+        return self.remember(key, depth, [cur_min_v, cur_action])
 
 
 # d: implementing alpha-beta
 class AlphaBetaAgent(MultiAgentSearchAgent):
   """
     Your minimax agent with alpha-beta pruning
+
+    The order in which moves are tried at both Pacman's and the ghosts' nodes
+    is set with ordering, a '+'-separated list of heuristics (or 'all'):
+
+      pv       the principal variation of the previous iteration comes first
+      killer   then up to two moves per ply that recently caused a cutoff
+      history  then moves by how often (agent, position, action) caused cutoffs
+      static   then moves by the evaluation of the state they lead to
+
+    e.g. -a depth=4,ordering=pv+killer+history.  Without it moves are tried in
+    getLegalActions order (after a transposition-table move, if any).
+    nodesPerPly counts the nodes visited at each ply during the last move.
   """
+  ORDERINGS = ['pv', 'killer', 'history', 'static']
+
+  def __init__(self, evalFn = 'betterEvaluationFunction', depth = '2', ordering = '', **args):
+    MultiAgentSearchAgent.__init__(self, evalFn, depth, **args)
+    if ordering == 'all': ordering = '+'.join(self.ORDERINGS)
+    self.ordering = [o for o in str(ordering).split('+') if o]
+    for o in self.ordering:
+      if o not in self.ORDERINGS: raise Exception('Unknown move ordering ' + o)
+    self.principalVariation = []
+    self.lastPrincipalVariation = [] # The principal variation of the previous move's search
+    self.pvLines = {} # ply -> best line found below that ply, as nested (action, rest) pairs
+    self.pvMatched = 0 # How many moves of the current path follow the principal variation
+    self.killers = {} # ply -> [killer, killer]
+    self.history = {} # (agent, position, action) -> cutoff score
+    self.nodesPerPly = {}
+    self.totalNodesPerPly = {}
+
+  def newSearch(self):
+    MultiAgentSearchAgent.newSearch(self)
+    if self.principalVariation:
+      self.lastPrincipalVariation = self.principalVariation
+    self.principalVariation = []
+    self.pvLines = {}
+    self.pvMatched = 0
+    self.killers = {}
+    # Old history still helps, but should give way to the new position
+    for k in self.history:
+      self.history[k] //= 2
+    self.nodesPerPly = {}
+
+  def reuseSearch(self, line):
+    # The rest of the previous principal variation, if the game followed it,
+    # leads the first iteration
+    pv = self.lastPrincipalVariation
+    if pv[:len(line)] == line:
+      self.principalVariation = pv[len(line):]
+
+  def getBranchingFactors(self):
+    """
+      Returns the ratio of nodes visited at each ply to the ply above it,
+      for the last move.
+    """
+    plies = sorted(self.nodesPerPly)
+    return [float(self.nodesPerPly[p + 1]) / self.nodesPerPly[p] for p in plies if p + 1 in self.nodesPerPly]
+
+  def successor(self, gameState, agent, action, probe = False):
+    pv = self.principalVariation
+    if self.pvMatched == self.ply and self.ply < len(pv) and pv[self.ply] == action:
+      self.pvMatched += 1
+    return MultiAgentSearchAgent.successor(self, gameState, agent, action, probe)
+
+  def restore(self, gameState):
+    MultiAgentSearchAgent.restore(self, gameState)
+    if self.pvMatched > self.ply:
+      self.pvMatched = self.ply
 
   def getAction(self, gameState):
     """
       Returns the minimax action using self.depth and self.evaluationFunction
     """
-    alpha_beta = self.alpha_beta(gameState, self.index, self.depth, -math.inf, math.inf)
+    alpha_beta = self.runSearch(gameState)
     return alpha_beta[1]
 
+  def searchNode(self, gameState, agent, depth):
+    return self.alpha_beta(gameState, agent, depth, -math.inf, math.inf)
+
+  def getRootActions(self, gameState, depth):
+    key, entry = self.probe(gameState, self.index)
+    return self.getAlphaBetaActions(gameState, self.index, depth, entry.action if entry is not None else None)
+
+  def combineRootValues(self, rootValues):
+    # The serial search visits each root child with alpha at the best value
+    # so far.  A child that is not a leaf then reports a value equal to alpha
+    # as a cutoff (-inf), so only a leaf can take over on a tie.
+    cur_max_v = -math.inf
+    cur_action = []
+    for action, v, leaf in rootValues:
+      if v > cur_max_v or (v == cur_max_v and (leaf or cur_max_v == -math.inf)):
+        cur_max_v = v
+        cur_action = action
+      if cur_max_v == math.inf:
+        break
+    return [cur_max_v, cur_action]
+
+  def __getstate__(self):
+    state = MultiAgentSearchAgent.__getstate__(self)
+    state['history'] = {}
+    state['nodesPerPly'] = {}
+    state['totalNodesPerPly'] = {}
+    return state
+
+  def search(self, gameState, depth):
+    result = MultiAgentSearchAgent.search(self, gameState, depth)
+    if 'pv' in self.ordering:
+      # Unroll the root's line for the next iteration to follow
+      line = []
+      node = self.pvLines.get(0)
+      while node is not None:
+        line.append(node[0])
+        node = node[1]
+      self.principalVariation = line
+    return result
+
+  def getAlphaBetaActions(self, gameState, agent, depth, hash_action):
+    """
+      Returns the legal actions of agent ordered by self.ordering.
+    """
+    if not self.ordering:
+      return self.getOrderedActions(gameState, agent, depth, hash_action)
+    actions = gameState.getLegalActions(agent)
+    if len(actions) < 2:
+      return actions
+    ply = self.ply
+    pv_action = None
+    if 'pv' in self.ordering and self.pvMatched == ply and ply < len(self.principalVariation):
+      pv_action = self.principalVariation[ply]
+    elif agent == 0 and depth == self.searchDepth:
+      pv_action = self.rootAction
+    killers = self.killers.get(ply, []) if 'killer' in self.ordering else []
+    position = gameState.getAgentPosition(agent)
+    # Pacman wants high evaluations first, the ghosts low ones
+    sign = 1 if agent == 0 else -1
+    keys = {}
+    for action in actions:
+      history = 0
+      if 'history' in self.ordering:
+        history = self.history.get((agent, position, action), 0)
+      static = 0
+      if 'static' in self.ordering:
+        if self.instruments is not None: self.instruments.countOrdering()
+        static = sign * self.evaluationFunction(self.successor(gameState, agent, action, True))
+        self.restore(gameState)
+      keys[action] = (action == pv_action, action == hash_action, action in killers, history, static)
+    return sorted(actions, key=lambda action: keys[action], reverse=True)
+
+  def countNode(self, ply):
+    self.nodesPerPly[ply] = self.nodesPerPly.get(ply, 0) + 1
+    self.totalNodesPerPly[ply] = self.totalNodesPerPly.get(ply, 0) + 1
+
+  def recordCutoff(self, gameState, agent, depth, action):
+    """
+      Remembers an action that caused a cutoff, for the killer and history
+      heuristics.
+    """
+    self.countCutoff()
+    killers = self.killers.setdefault(self.ply, [])
+    if action not in killers:
+      killers.insert(0, action)
+      del killers[2:]
+    key = (agent, gameState.getAgentPosition(agent), action)
+    self.history[key] = self.history.get(key, 0) + depth * depth
+
   def alpha_beta(self, gameState, agent, depth, alpha, beta):
     if agent >= gameState.getNumAgents():
         agent = 0
         depth -= 1
+    self.countNode(self.ply)
     if gameState.isWin() or gameState.isLose() or depth == 0:
         return [self.evaluationFunction(gameState), []]
+    self.checkTime()
+    if self.isBatched(agent, depth):
+        return self.batchSearch(gameState)
+
+    # A stored result can settle this node outright; otherwise its best action is tried first
+    key, entry = self.probe(gameState, agent)
+    hash_action = None
+    if entry is not None:
+        if entry.depth >= depth:
+            if entry.flag == EXACT:
+                return [entry.value, entry.action]
+            if entry.flag == LOWER and entry.value >= beta:
+                return [math.inf, entry.action]
+            if entry.flag == UPPER and entry.value <= alpha:
+                return [-math.inf, entry.action]
+        hash_action = entry.action
+    orig_alpha, orig_beta = alpha, beta
+    actions = self.getAlphaBetaActions(gameState, agent, depth, hash_action)
+    track_pv = 'pv' in self.ordering
+    child_ply = self.ply + 1
 
     if agent == 0:
         cur_max_v = -math.inf
         cur_action = []
-        for action in gameState.getLegalActions(agent):
-            c = gameState.generateSuccessor(agent, action)
+        for action in actions:
+            if track_pv: self.pvLines[child_ply] = None
+            c = self.successor(gameState, agent, action)
             v = self.alpha_beta(c, agent+1, depth, alpha, beta)[0]
+            self.restore(gameState)
             if v >= cur_max_v:
                 cur_max_v = v
                 cur_action = action
+                if track_pv: self.pvLines[child_ply - 1] = (action, self.pvLines.get(child_ply))
             alpha = max(cur_max_v, alpha)
             if cur_max_v >= beta:
-                return [math.inf, cur_action]
-        return [cur_max_v, cur_action]
+                self.recordCutoff(gameState, agent, depth, cur_action)
+                return self.remember(key, depth, [math.inf, cur_action], LOWER, cur_max_v)
+        if cur_max_v <= orig_alpha:
+            # Children cut off below alpha are only known to be <= alpha
+            return self.remember(key, depth, [cur_max_v, cur_action], UPPER, orig_alpha)
+        return self.remember(key, depth, [cur_max_v, cur_action])
 
     else:
         cur_min_v = math.inf
         cur_action = []
-        for action in gameState.getLegalActions(agent):
-            c = gameState.generateSuccessor(agent, action)
+        for action in actions:
+            if track_pv: self.pvLines[child_ply] = None
+            c = self.successor(gameState, agent, action)
             v = self.alpha_beta(c, agent+1, depth, alpha, beta)[0]
+            self.restore(gameState)
             if v <= cur_min_v:
                 cur_min_v = v
                 cur_action = action
+                if track_pv: self.pvLines[child_ply - 1] = (action, self.pvLines.get(child_ply))
             beta = min(cur_min_v, beta)
             if cur_min_v <= alpha:
-                return [-math.inf, cur_action]
-        return [cur_min_v, cur_action]
+                self.recordCutoff(gameState, agent, depth, cur_action)
+                return self.remember(key, depth, [-math.inf, cur_action], UPPER, cur_min_v)
+        if cur_min_v >= orig_beta:
+            # Children cut off above beta are only known to be >= beta
+            return self.remember(key, depth, [cur_min_v, cur_action], LOWER, orig_beta)
+        return self.remember(key, depth, [cur_min_v, cur_action])
 
 
 # e: implementing random expectimax
@@ -323,87 +1071,264 @@ class RandomExpectimaxAgent(MultiAgentSearchAgent):
       Returns the expectimax action using self.depth and self.evaluationFunction
       All ghosts should be modeled as choosing uniformly at random from their legal moves.
     """
-    random_expectimax = self.random_expectimax(gameState, self.index, self.depth)
+    random_expectimax = self.runSearch(gameState)
     return random_expectimax[1]
 
+  def searchNode(self, gameState, agent, depth):
+    return self.random_expectimax(gameState, agent, depth)
+
+  def combineGhostValues(self, gameState, agent, values):
+    # Sum in the serial search's order so the floating-point result matches
+    p = 1.0/float(len(gameState.getLegalActions(agent)))
+    v = 0
+    for action in gameState.getLegalActions(agent):
+      v += p * values[action]
+    return v
+
   def random_expectimax(self, gameState, agent, depth):
     if agent >= gameState.getNumAgents():
         agent = 0
         depth -= 1
     if gameState.isWin() or gameState.isLose() or depth == 0:
         return [self.evaluationFunction(gameState), []]
+    self.checkTime()
+    if self.isBatched(agent, depth):
+        return self.batchSearch(gameState)
+
+    key, entry = self.probe(gameState, agent)
+    if entry is not None and entry.depth >= depth:
+        return [entry.value, entry.action]
 
     if agent == 0:
         cur_max_v = -math.inf
         cur_action = []
-        for action in gameState.getLegalActions(agent):
-            c = gameState.generateSuccessor(agent, action)
+        for action in self.getOrderedActions(gameState, agent, depth):
+            c = self.successor(gameState, agent, action)
             v = self.random_expectimax(c, agent + 1, depth)[0]
+            self.restore(gameState)
             if v >= cur_max_v:
                 cur_max_v = v
                 cur_action = action
-        return [cur_max_v, cur_action]
+        return self.remember(key, depth, [cur_max_v, cur_action])
 
     else:
         action = []
         p = 1.0/float(len(gameState.getLegalActions(agent)))
         v = 0
         for action in gameState.getLegalActions(agent):
-            c = gameState.generateSuccessor(agent, action)
+            c = self.successor(gameState, agent, action)
             v += p * self.random_expectimax(c, agent + 1, depth)[0]
-        return [v, action]
+            self.restore(gameState)
+        return self.remember(key, depth, [v, action])
 
 
 # f: implementing directional expectimax
 class DirectionalExpectimaxAgent(MultiAgentSearchAgent):
   """
     Your expectimax agent
+
+    Ghost distributions are memoized per (ghost position, direction, scared,
+    Pacman position), since the same ghost moves are weighed over and over.
+    Two optional ways to search fewer ghost moves:
+
+      threshold=p  Ghost moves less likely than p are not searched; the
+                   remaining probabilities are scaled back up to 1.  This
+                   changes the values (see experiment_thresholds.py).
+      star1=True   Ballard's Star1 pruning: with bounds on the evaluation
+                   (getEvaluationBounds), a ghost node stops as soon as its
+                   expected value can no longer matter to the max nodes
+                   above it.  Exact: the same action is chosen.
   """
 
+  def __init__(self, evalFn = 'betterEvaluationFunction', depth = '2', threshold = '0', star1 = 'False', **args):
+    MultiAgentSearchAgent.__init__(self, evalFn, depth, **args)
+    self.threshold = float(threshold)
+    self.star1 = isTrue(star1)
+    self.distributions = {}
+    self.distributionWalls = None
+    self.evaluationBounds = (-math.inf, math.inf)
+    self.rootValue = None # Value of the last getAction's search
+    self.searchStats = util.Counter()
+    self.totalStats = util.Counter()
+
   def getAction(self, gameState):
     """
       Returns the expectimax action using self.depth and self.evaluationFunction
       All ghosts should be modeled as using the DirectionalGhost distribution to choose from their legal moves.
     """
-
-    dir_random_expectimax = self.directional_random_expectimax(gameState, self.index, self.depth)
+    walls = gameState.data.layout.walls
+    if walls != self.distributionWalls:
+      self.distributions = {}
+      self.distributionWalls = walls
+
+    dir_random_expectimax = self.runSearch(gameState)
+    self.rootValue = dir_random_expectimax[0]
+    for name, count in self.searchStats.items():
+      self.totalStats[name] += count
     return dir_random_expectimax[1]
 
-  def directional_random_expectimax(self, gameState, agent, depth):
+  def newSearch(self):
+    MultiAgentSearchAgent.newSearch(self)
+    self.searchStats = util.Counter()
+
+  def __getstate__(self):
+    state = MultiAgentSearchAgent.__getstate__(self)
+    state['distributions'] = {}
+    state['distributionWalls'] = None
+    state['evaluationBounds'] = (-math.inf, math.inf)
+    state['rootValue'] = None
+    state['searchStats'] = util.Counter()
+    state['totalStats'] = util.Counter()
+    return state
+
+  def searchNode(self, gameState, agent, depth):
+    if self.star1:
+      self.evaluationBounds = self.getEvaluationBounds(gameState, depth)
+    return self.directional_random_expectimax(gameState, agent, depth, -math.inf, math.inf)
+
+  def combineGhostValues(self, gameState, agent, values):
+    # Sum in the serial search's order so the floating-point result matches
+    v = 0
+    for action, prob in self.getChanceDistribution(gameState, agent):
+      v += prob * values[action]
+    return v
+
+  def getEvaluationBounds(self, gameState, depth):
+    """
+      Returns (lower, upper) bounds on the evaluation of any state within
+      depth rounds of gameState, for Star1 pruning.  These hold for the
+      evaluation functions in this file: Pacman nets at most 9 for each
+      food he eats (one per move), 200 per ghost per round while there are
+      capsules or scared ghosts left, 500 for winning if the food can run
+      out, and 4 from betterEvaluationFunction's distance terms; losing
+      evaluates to -10000 (or 500 less than the score).
+    """
+    score = gameState.getScore()
+    numFood = gameState.getNumFood()
+    numGhosts = gameState.getNumAgents() - 1
+    upper = score + 9 * min(depth, numFood) + 4
+    if gameState.getCapsules() or [i for i in range(1, numGhosts + 1) if gameState.getScaredTimer(i) > 0]:
+      upper += 200 * numGhosts * depth
+    if numFood <= depth:
+      upper += 500
+    lower = min(-10000, score - depth - 502)
+    return (lower, upper)
+
+  def getGhostDistribution(self, gameState, agent):
+    """
+      Returns the (action, probability) pairs of getDistribution, memoized.
+    """
+    key = (gameState.getAgentPosition(agent), gameState.getAgentDirection(agent),
+           gameState.getScaredTimer(agent) > 0, gameState.getAgentPosition(0))
+    dist = self.distributions.get(key)
+    if dist is None:
+      self.searchStats['distributionMisses'] += 1
+      dist = self.distributions[key] = tuple(getDistribution(gameState, agent).items())
+    else:
+      self.searchStats['distributionHits'] += 1
+    return dist
+
+  def getChanceDistribution(self, gameState, agent):
+    """
+      Returns the (action, probability) pairs searched at a ghost node: the
+      ghost's distribution less the moves under the threshold, rescaled.
+    """
+    dist = self.getGhostDistribution(gameState, agent)
+    if self.threshold <= 0:
+      return dist
+    kept = [(action, prob) for action, prob in dist if prob >= self.threshold]
+    if not kept:
+      kept = [max(dist, key=lambda item: item[1])]
+    if len(kept) == len(dist):
+      return dist
+    self.searchStats['prunedMoves'] += len(dist) - len(kept)
+    mass = sum([prob for action, prob in kept])
+    return [(action, prob / mass) for action, prob in kept]
+
+  def getPruningStats(self):
+    """
+      Returns the counters of the last search and of all searches so far:
+      chance nodes searched, moves skipped by the threshold, Star1 cutoffs
+      and distribution cache hits and misses.
+    """
+    return self.searchStats.copy(), self.totalStats.copy()
+
+  def directional_random_expectimax(self, gameState, agent, depth, alpha = -math.inf, beta = math.inf):
+      """
+        Star1 windows: a node whose value is below alpha returns -inf and
+        one above beta returns inf.  Windows are widened by a hair (slack)
+        so that rounding never cuts off a node that ties alpha or beta.
+      """
 
       if agent >= gameState.getNumAgents():
           agent = 0
           depth -= 1
       if gameState.isWin() or gameState.isLose() or depth == 0:
           return [self.evaluationFunction(gameState), []]
+      self.checkTime()
+      if self.isBatched(agent, depth):
+          return self.batchSearch(gameState)
+
+      key, entry = self.probe(gameState, agent)
+      if entry is not None and entry.depth >= depth:
+          return [entry.value, entry.action]
 
       if agent == 0:
           cur_max_v = -math.inf
           cur_action = []
-          for action in gameState.getLegalActions(agent):
-              c = gameState.generateSuccessor(agent, action)
-              v = self.directional_random_expectimax(c, agent + 1, depth)[0]
+          for action in self.getOrderedActions(gameState, agent, depth):
+              c = self.successor(gameState, agent, action)
+              v = self.directional_random_expectimax(c, agent + 1, depth, max(alpha, cur_max_v), beta)[0]
+              self.restore(gameState)
               if v >= cur_max_v:
                   cur_max_v = v
                   cur_action = action
-          return [cur_max_v, cur_action]
+              if cur_max_v > beta:
+                  self.countCutoff()
+                  return [math.inf, cur_action]
+          if cur_max_v < alpha:
+              return [-math.inf, cur_action]
+          return self.remember(key, depth, [cur_max_v, cur_action])
 
 
       else:
           action = []
-          dist = getDistribution(gameState, agent)
+          dist = self.getChanceDistribution(gameState, agent)
+          self.searchStats['chanceNodes'] += 1
+          lower, upper = self.evaluationBounds
+          remaining = 1.0
           v = 0
-          for action,prob in dist.items():
-              c = gameState.generateSuccessor(agent, action)
-              v += prob * self.directional_random_expectimax(c, agent + 1, depth)[0]
-          return [v, action]
+          for action,prob in dist:
+              child_alpha, child_beta = -math.inf, math.inf
+              if self.star1:
+                  # The node's value lies within v + remaining * [lower, upper]
+                  if v + remaining * upper < alpha - slack(alpha) or v + remaining * lower > beta + slack(beta):
+                      self.searchStats['star1Cutoffs'] += 1
+                      self.countCutoff()
+                      return [-math.inf if v + remaining * upper < alpha else math.inf, action]
+                  remaining = max(0.0, remaining - prob)
+                  child_alpha = (alpha - v - remaining * upper) / prob
+                  child_alpha -= slack(child_alpha)
+                  child_beta = (beta - v - remaining * lower) / prob
+                  child_beta += slack(child_beta)
+              c = self.successor(gameState, agent, action)
+              child = self.directional_random_expectimax(c, agent + 1, depth, child_alpha, child_beta)[0]
+              self.restore(gameState)
+              if child == -math.inf or child == math.inf:
+                  return [child, action]
+              v += prob * child
+          return self.remember(key, depth, [v, action])
+
+
+def slack(bound):
+    "Rounding allowance for Star1 windows around bound."
+    return 1e-9 * (1 + abs(bound))
 
 
 def getDistribution(gameState, agent):
-    ghostState = gameState.getGhostState(agent)
     legalActions = gameState.getLegalActions(agent)
     pos = gameState.getGhostPosition(agent)
-    isScared = ghostState.scaredTimer > 0
+    isScared = gameState.getScaredTimer(agent) > 0
 
     speed = 1
     if isScared: speed = 0.5
@@ -441,27 +1366,37 @@ class CompetitionAgent(MultiAgentSearchAgent):
     Your competition agent
   """
   def getAction(self, gameState):
-    competition = self.competition(gameState, self.index, 3, -math.inf, math.inf)
+    competition = self.runSearch(gameState, 3)
     return competition[1]
 
+  def searchNode(self, gameState, agent, depth):
+    return self.competition(gameState, agent, depth, -math.inf, math.inf)
+
+  combineRootValues = AlphaBetaAgent.combineRootValues
+
   def competition(self, gameState, agent, depth, alpha, beta):
     if agent >= gameState.getNumAgents():
         agent = 0
         depth -= 1
     if gameState.isWin() or gameState.isLose() or depth == 0:
         return [self.evaluationFunction(gameState), []]
+    self.checkTime()
+    if self.isBatched(agent, depth):
+        return self.batchSearch(gameState)
 
     if agent == 0:
         cur_max_v = -math.inf
         cur_action = []
-        for action in gameState.getLegalActions(agent):
-            c = gameState.generateSuccessor(agent, action)
+        for action in self.getOrderedActions(gameState, agent, depth):
+            c = self.successor(gameState, agent, action)
             v = self.competition(c, agent+1, depth, alpha, beta)[0]
+            self.restore(gameState)
             if v >= cur_max_v:
                 cur_max_v = v
                 cur_action = action
             alpha = max(cur_max_v, alpha)
             if cur_max_v >= beta:
+                self.countCutoff()
                 return [math.inf, cur_action]
         return [cur_max_v, cur_action]
 
@@ -469,14 +1404,220 @@ class CompetitionAgent(MultiAgentSearchAgent):
         cur_min_v = math.inf
         cur_action = []
         for action in gameState.getLegalActions(agent):
-            c = gameState.generateSuccessor(agent, action)
+            c = self.successor(gameState, agent, action)
             v = self.competition(c, agent+1, depth, alpha, beta)[0]
+            self.restore(gameState)
             if v <= cur_min_v:
                 cur_min_v = v
                 cur_action = action
             beta = min(cur_min_v, beta)
             if cur_min_v <= alpha:
+                self.countCutoff()
                 return [-math.inf, cur_action]
         return [cur_min_v, cur_action]
 
 
+
+
+# Monte Carlo tree search
+def randomRolloutPolicy(gameState, actions, rng):
+  """
+    Rollout policy: a legal action chosen uniformly at random.
+  """
+  return rng.choice(actions)
+
+
+def greedyRolloutPolicy(gameState, actions, rng):
+  """
+    Rollout policy: moves onto food when a neighbouring square has some,
+    otherwise mostly keeps going the same way (rather than dithering back
+    and forth), otherwise picks at random.
+  """
+  conf = gameState.data.agentStates[0].configuration
+  x, y = conf.pos
+  eating = []
+  for action in actions:
+    dx, dy = Actions.directionToVector(action)
+    if gameState.hasFood(int(x + dx), int(y + dy)): eating.append(action)
+  if eating: return rng.choice(eating)
+  if conf.direction in actions and rng.random() < 0.75: return conf.direction
+  return rng.choice(actions)
+
+
+class MCTSNode:
+  """
+    A state where Pacman is to move in the Monte Carlo search tree.  Edges
+    hold the visit count and total value of each of Pacman's actions; an
+    action leads to one child per ghost reply seen so far, keyed by the
+    resulting state's getKey().
+  """
+  __slots__ = ('visits', 'untried', 'actionVisits', 'actionValues', 'children')
+
+  def __init__(self):
+    self.visits = 0
+    self.untried = None # Actions not tried yet, filled in on the first visit
+    self.actionVisits = {}
+    self.actionValues = {}
+    self.children = {}
+
+
+class MCTSAgent(Agent):
+  """
+    A UCT (Monte Carlo tree search) agent.  Each iteration walks down the
+    tree choosing Pacman's actions by UCB1 and sampling the ghosts' replies
+    from their ghostAgents distributions, adds one node, plays a rollout
+    from it and backs the evaluation of where the rollout ends up along the
+    path.  Pacman plays the most visited action.
+
+    Iterations run on one working state with applyMove/undoMove, so a
+    rollout costs no state copies.  The subtree reached by the move played
+    and the ghosts' actual replies is kept for the next move.
+
+      iterations    iterations per move (0: no limit, needs a timeLimit)
+      timeLimit     seconds per move (0: no limit)
+      rollout       rollout policy (randomRolloutPolicy, greedyRolloutPolicy)
+      rolloutDepth  rounds per rollout
+      exploration   UCB1 exploration constant, on values scaled to [0, 1]
+      ghosts        ghost model, a GhostAgent class in ghostAgents.py
+      reuse         keep the tree between moves
+      seed          seed of the agent's own random numbers
+  """
+
+  def __init__(self, evalFn = 'scoreEvaluationFunction', iterations = '1000', timeLimit = '0',
+               rollout = 'randomRolloutPolicy', rolloutDepth = '10', exploration = '1.0',
+               ghosts = 'DirectionalGhost', reuse = 'True', seed = '0'):
+    import ghostAgents
+    self.index = 0
+    self.evaluationFunction = util.lookup(evalFn, globals())
+    self.iterations = int(iterations)
+    self.timeLimit = float(timeLimit)
+    if self.iterations <= 0 and self.timeLimit <= 0:
+      raise Exception('MCTSAgent needs a number of iterations or a time limit')
+    self.rolloutPolicy = util.lookup(rollout, globals())
+    self.rolloutDepth = int(rolloutDepth)
+    self.exploration = float(exploration)
+    self.ghostType = getattr(ghostAgents, ghosts)
+    self.ghostModels = []
+    self.reuse = isTrue(reuse)
+    self.rng = random.Random(int(seed))
+    self.root = None
+    self.lastAction = None
+    self.low, self.high = math.inf, -math.inf # Range of the values seen
+    self.lastIterations = 0
+    self.lastTime = 0.0
+
+  def getAction(self, gameState):
+    """
+      Searches from gameState within the iteration and time budget and
+      returns the most visited action.
+    """
+    start = time.time()
+    root = self.getRoot(gameState)
+    if len(self.ghostModels) != gameState.getNumAgents() - 1:
+      self.ghostModels = [self.ghostType(i) for i in range(1, gameState.getNumAgents())]
+
+    iterations = 0
+    deadline = start + self.timeLimit if self.timeLimit > 0 else None
+    while self.iterations <= 0 or iterations < self.iterations:
+      if deadline is not None and time.time() > deadline: break
+      self.iterate(root, gameState)
+      iterations += 1
+    self.lastIterations = iterations
+    self.lastTime = time.time() - start
+
+    actions = gameState.getLegalActions(0)
+    action = max(actions, key=lambda a: (root.actionVisits.get(a, 0), root.actionValues.get(a, 0)))
+    self.root, self.lastAction = root, action
+    return action
+
+  def getRoot(self, gameState):
+    """
+      Returns the node for gameState: the subtree the last move and the
+      ghosts' replies led to, if it was explored, else a new node.
+    """
+    if self.reuse and self.root is not None:
+      node = self.root.children.get(self.lastAction, {}).get(gameState.getKey())
+      if node is not None:
+        return node
+    self.low, self.high = math.inf, -math.inf
+    return MCTSNode()
+
+  def iterate(self, root, gameState):
+    """
+      Runs one selection, expansion, rollout and backup pass, leaving
+      gameState as it found it.
+    """
+    mark = gameState.getNumUndoMoves()
+    path = []
+    node = root
+    while node is not None and not (gameState.isWin() or gameState.isLose()):
+      if node.untried is None:
+        node.untried = list(gameState.getLegalActions(0))
+        self.rng.shuffle(node.untried)
+      if node.untried:
+        action = node.untried.pop()
+      else:
+        action = self.selectAction(node)
+      path.append((node, action))
+      self.playRound(gameState, action)
+      outcomes = node.children.setdefault(action, {})
+      key = gameState.getKey()
+      node = outcomes.get(key)
+      if node is None:
+        outcomes[key] = MCTSNode()
+
+    value = self.rolloutValue(gameState)
+    while gameState.getNumUndoMoves() > mark:
+      gameState.undoMove()
+
+    self.low, self.high = min(self.low, value), max(self.high, value)
+    for node, action in path:
+      node.visits += 1
+      node.actionVisits[action] = node.actionVisits.get(action, 0) + 1
+      node.actionValues[action] = node.actionValues.get(action, 0) + value
+
+  def selectAction(self, node):
+    """
+      Returns the action with the highest UCB1 score, on values scaled to
+      [0, 1] by the range seen so far.
+    """
+    scale = self.high - self.low if self.high > self.low else 1.0
+    logVisits = math.log(node.visits)
+    best, bestScore = None, -math.inf
+    for action, visits in node.actionVisits.items():
+      mean = (node.actionValues[action] / visits - self.low) / scale
+      score = mean + self.exploration * math.sqrt(logVisits / visits)
+      if score > bestScore:
+        best, bestScore = action, score
+    return best
+
+  def playRound(self, gameState, action):
+    "Applies Pacman's action and a sampled reply from each ghost in place."
+    gameState.applyMove(0, action)
+    for ghost in self.ghostModels:
+      if gameState.isWin() or gameState.isLose(): return
+      gameState.applyMove(ghost.index, self.sample(ghost.getDistribution(gameState)))
+
+  def sample(self, distribution):
+    "Draws an action from distribution with the agent's own random numbers."
+    r = self.rng.random() * distribution.totalCount()
+    for action, prob in distribution.items():
+      r -= prob
+      if r <= 0: return action
+    return action
+
+  def rolloutValue(self, gameState):
+    """
+      Plays up to rolloutDepth rounds from gameState with the rollout
+      policy and returns the evaluation of where they end.  The moves are
+      left applied; the caller takes them back.
+    """
+    for i in range(self.rolloutDepth):
+      if gameState.isWin() or gameState.isLose(): break
+      self.playRound(gameState, self.rolloutPolicy(gameState, gameState.getLegalActions(0), self.rng))
+    return self.evaluationFunction(gameState)
+
+  def getSearchStats(self):
+    "Iterations and iterations per second of the last move."
+    rate = self.lastIterations / self.lastTime if self.lastTime > 0 else 0.0
+    return {'iterations': self.lastIterations, 'time': self.lastTime, 'iterationsPerSecond': rate}
@@ -0,0 +1,231 @@
+"""
+Runs a grid of experiments (agents x depths x ghosts x layouts, a number of
+games per cell) on a pool of worker processes, and writes the averages to
+results_<layout>.csv in the format experiments.py writes and stats.py reads
+(see write_results):
+
+  agent,depth,layout,average score,average seconds per move
+
+Pacman's move-time percentiles go to latency_<layout>.csv beside it, in the
+format of experiments.latency_line.
+
+The pool stays up for the whole sweep and is fed single games, so slow
+cells don't hold up the rest.  Every finished cell is appended to a
+checkpoint file; running the same sweep again skips the cells already
+there, so an interrupted sweep picks up where it stopped.  The CSV files
+are rewritten (to a temporary file, then renamed) each time a cell
+finishes, so they always hold whole lines for the cells done so far.
+
+  python sweep.py [--grid grid.json] [--workers N] [--out DIR] [--fresh]
+
+A grid file is a JSON object with the keys of GRID below.  agentArgs maps
+an agent to extra arguments in pacman.py's -a form.  Agents that don't
+search get one cell at depth 1, as in experiments.py.  Games are seeded
+with seed + game number, so a cell's results don't depend on the worker
+that played it.
+
+Search agents given instrument=True in agentArgs also leave their summed
+search counts (searchInstruments.mergeStats) under 'search' in the cell's
+checkpoint record.
+"""
+from optparse import OptionParser
+import json
+import multiprocessing
+import os
+import random
+import time
+
+import searchInstruments
+import util
+
+GRID = {
+    'agents': ['OriginalReflexAgent', 'ReflexAgent', 'MinimaxAgent', 'AlphaBetaAgent', 'RandomExpectimaxAgent'],
+    'agentArgs': {},
+    'depths': [2, 3, 4],
+    'ghosts': ['RandomGhost'],
+    'layouts': ['trickyClassic'],
+    'games': 7,
+    'seed': 0,
+    'timeout': 30,
+}
+
+CHECKPOINT_FILE = 'sweep_checkpoint.jsonl'
+
+
+def make_cells(grid):
+    """
+    Returns the cells of grid, in the order they are written out, as
+    (agent, depth, ghost, layout) tuples.
+    """
+    import submission
+    cells = []
+    for layout_name in grid['layouts']:
+        for ghost in grid['ghosts']:
+            for agent in grid['agents']:
+                searches = issubclass(getattr(submission, agent), submission.MultiAgentSearchAgent)
+                for depth in (grid['depths'] if searches else [1]):
+                    cells.append((agent, depth, ghost, layout_name))
+    return cells
+
+
+def cell_key(grid, cell):
+    "Identifies a cell's results in the checkpoint, settings included."
+    agent, depth, ghost, layout_name = cell
+    return json.dumps([agent, depth, ghost, layout_name, grid['agentArgs'].get(agent, ''),
+                       grid['games'], grid['seed'], grid['timeout']])
+
+
+def load_checkpoint(path):
+    "Returns the finished cells in the checkpoint file, by cell_key."
+    done = {}
+    if not os.path.exists(path): return done
+    with open(path) as file_ptr:
+        for line in file_ptr:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue # A line cut short by an interruption
+            done[record['key']] = record
+    return done
+
+
+def append_checkpoint(path, record):
+    with open(path, 'a') as file_ptr:
+        file_ptr.write(json.dumps(record) + '\n')
+        file_ptr.flush()
+        os.fsync(file_ptr.fileno())
+
+
+def write_atomically(path, text):
+    temp = '%s.%d.tmp' % (path, os.getpid())
+    with open(temp, 'w') as file_ptr:
+        file_ptr.write(text)
+    os.replace(temp, path)
+
+
+def csv_line(cell, record):
+    "A line in the format of experiments.run_game."
+    agent, depth, ghost, layout_name = cell
+    avg_score = sum(record['scores']) / float(len(record['scores']))
+    avg_time = sum(record['times']) / float(len(record['times']))
+    return (agent + ',' + str(depth) + ',' + layout_name + ',' +
+            '%.2f' % avg_score + ',' + '%.2f' % (avg_time * 1e6) + 'E-06\n')
+
+
+def latency_csv_line(cell, record):
+    """
+    A line in the format of experiments.latency_line.  Cells checkpointed
+    before move times were recorded get blank move-time columns.
+    """
+    from experiments import latency_line
+    agent, depth, ghost, layout_name = cell
+    return latency_line(agent, depth, layout_name, record.get('latency'))
+
+
+def write_results(grid, cells, done, out_dir):
+    """
+    Rewrites results_<layout>.csv and latency_<layout>.csv with the
+    finished cells of each layout (results_<layout>_<ghost>.csv and so on
+    when the grid has several ghost types, since the lines don't say which
+    ghosts were played).
+    """
+    for layout_name in grid['layouts']:
+        for ghost in grid['ghosts']:
+            finished = [cell for cell in cells
+                        if cell[2:] == (ghost, layout_name) and cell_key(grid, cell) in done]
+            suffix = layout_name + ('_' + ghost if len(grid['ghosts']) > 1 else '') + '.csv'
+            for prefix, line in [('results_', csv_line), ('latency_', latency_csv_line)]:
+                lines = [line(cell, done[cell_key(grid, cell)]) for cell in finished]
+                if lines:
+                    write_atomically(os.path.join(out_dir, prefix + suffix), ''.join(lines) + '\n')
+
+
+def play_game(task):
+    """
+    Plays one game of a cell in a worker; returns (cell, game, score, avg
+    move time, pacman's util.LatencyHistogram, its search counts or None).
+    """
+    from layout import getLayout
+    from pacman import ClassicGameRules, parseAgentArgs
+    import ghostAgents, submission, textDisplay
+    cell, agent_args, game_index, seed, timeout = task
+    agent, depth, ghost, layout_name = cell
+    args = parseAgentArgs(agent_args) if agent_args else {}
+    agent_type = getattr(submission, agent)
+    if issubclass(agent_type, submission.MultiAgentSearchAgent):
+        args['depth'] = str(depth)
+        args['parallel'] = '0' # The sweep is already spread over the cores
+    layout = getLayout(layout_name)
+    ghosts = [getattr(ghostAgents, ghost)(i + 1) for i in range(layout.getNumGhosts())]
+    random.seed(seed)
+    rules = ClassicGameRules(timeout)
+    game = rules.newGame(layout, agent_type(**args), ghosts, textDisplay.NullGraphics(), True, False)
+    game.runFast()
+    pacman = game.agents[0]
+    search_stats = pacman.getGameStats() if hasattr(pacman, 'getGameStats') else None
+    if search_stats is not None:
+        del search_stats['moves']
+    return cell, game_index, game.state.getScore(), game.my_avg_time, game.moveTimes[0], search_stats
+
+
+def run_sweep(grid, workers=None, out_dir='.', fresh=False):
+    """
+    Runs the cells of grid that the checkpoint in out_dir doesn't already
+    hold, and writes the CSV files.  Returns the number of cells run.
+    """
+    grid = dict(GRID, **grid)
+    cells = make_cells(grid)
+    if not os.path.isdir(out_dir): os.makedirs(out_dir)
+    checkpoint = os.path.join(out_dir, CHECKPOINT_FILE)
+    if fresh and os.path.exists(checkpoint): os.remove(checkpoint)
+    done = load_checkpoint(checkpoint)
+    pending = [cell for cell in cells if cell_key(grid, cell) not in done]
+    print('%d cells, %d already done' % (len(cells), len(cells) - len(pending)))
+    if not pending: return 0
+
+    games = grid['games']
+    tasks = [(cell, grid['agentArgs'].get(cell[0], ''), i, grid['seed'] + i, grid['timeout'])
+             for cell in pending for i in range(games)]
+    results = dict([(cell, [None] * games) for cell in pending])
+    remaining = dict([(cell, games) for cell in pending])
+    finished = len(cells) - len(pending)
+    pool = multiprocessing.Pool(workers or multiprocessing.cpu_count())
+    try:
+        for cell, game_index, score, avg_time, move_times, search_stats in pool.imap_unordered(play_game, tasks, 1):
+            results[cell][game_index] = (score, avg_time, move_times, search_stats)
+            remaining[cell] -= 1
+            if remaining[cell] == 0:
+                latency = util.LatencyHistogram()
+                for r in results[cell]:
+                    latency.merge(r[2])
+                record = {'key': cell_key(grid, cell), 'cell': list(cell),
+                          'scores': [r[0] for r in results[cell]], 'times': [r[1] for r in results[cell]],
+                          'latency': latency.getSummary()}
+                if results[cell][0][3] is not None:
+                    record['search'] = searchInstruments.mergeStats([r[3] for r in results[cell]])
+                append_checkpoint(checkpoint, record)
+                done[record['key']] = record
+                write_results(grid, cells, done, out_dir)
+                finished += 1
+                print('[%d/%d] ghosts=%s: %s' % (finished, len(cells), cell[2], csv_line(cell, record).strip()))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return len(pending)
+
+
+if __name__ == '__main__':
+    parser = OptionParser('python sweep.py [options]')
+    parser.add_option('--grid', dest='grid', help='A JSON file with the grid to run (default: GRID in sweep.py)', default=None)
+    parser.add_option('--workers', dest='workers', type='int', help='Number of worker processes (default: one per core)', default=None)
+    parser.add_option('--out', dest='out', help='Directory for the CSV files and the checkpoint', default='.')
+    parser.add_option('--fresh', dest='fresh', action='store_true', help='Ignore the checkpoint and run every cell', default=False)
+    options, args = parser.parse_args()
+    grid = {}
+    if options.grid:
+        with open(options.grid) as file_ptr:
+            grid = json.load(file_ptr)
+    base = time.time()
+    run_sweep(grid, options.workers, options.out, options.fresh)
+    print('sweep time: ' + str((time.time() - base)/60) + ' min')
@@ -1,6 +1,7 @@
 import sys
 import inspect
 import heapq, random
+import math
 
 
 """
@@ -85,7 +86,152 @@ class PriorityQueueWithFunction(PriorityQueue):
     "Adds an item to the queue with priority from the priority function"
     PriorityQueue.push(self, item, self.priorityFunction(item))
 
-    
+class TranspositionEntry:
+  "One stored search result; see TranspositionTable."
+  __slots__ = ('key', 'value', 'flag', 'action', 'depth', 'age')
+
+  def __init__(self, key, value, flag, action, depth, age):
+    self.key = key
+    self.value = value
+    self.flag = flag
+    self.action = action
+    self.depth = depth
+    self.age = age
+
+class TranspositionTable:
+  """
+    A fixed-size table of search results, so that a position reached along
+    different paths is only searched once.
+
+    Each entry holds the value found for a position, whether that value is
+    exact or only a lower/upper bound (after an alpha-beta cutoff), the best
+    action and the remaining depth it was searched to.  The table has one
+    slot per hash bucket: a new result replaces the stored one if it was
+    searched at least as deeply, or if the stored one is left over from an
+    older search (see newSearch).
+  """
+  EXACT = 0
+  LOWER = 1 # The true value is >= the stored value
+  UPPER = 2 # The true value is <= the stored value
+
+  def __init__(self, size=65536):
+    self.size = size
+    self.slots = [None] * size
+    self.age = 0
+    self.hits = 0
+    self.misses = 0
+    self.stores = 0
+    self.replacements = 0
+    self.rejections = 0
+
+  def newSearch(self):
+    "Marks the entries stored so far as belonging to an older search."
+    self.age += 1
+
+  def lookup(self, key):
+    "Returns the TranspositionEntry stored for key, or None."
+    entry = self.slots[hash(key) % self.size]
+    if entry is not None and entry.key == key:
+      self.hits += 1
+      return entry
+    self.misses += 1
+    return None
+
+  def store(self, key, depth, value, flag, action):
+    index = hash(key) % self.size
+    old = self.slots[index]
+    if old is not None:
+      if old.age == self.age and old.depth > depth and old.key != key:
+        self.rejections += 1
+        return
+      self.replacements += 1
+    self.stores += 1
+    self.slots[index] = TranspositionEntry(key, value, flag, action, depth, self.age)
+
+  def clear(self):
+    self.slots = [None] * self.size
+
+  def getStats(self):
+    "Returns a dict of counters that help choose the table size."
+    lookups = self.hits + self.misses
+    return {'size': self.size,
+            'filled': self.size - self.slots.count(None),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': float(self.hits) / lookups if lookups else 0.0,
+            'stores': self.stores,
+            'replacements': self.replacements,
+            'rejections': self.rejections}
+
+class LatencyHistogram:
+  """
+    A fixed-size histogram of durations (in seconds), for percentiles of
+    move times without keeping every move.
+
+    Buckets grow geometrically by BUCKET_RATIO from MIN_SECONDS, so a
+    percentile is reported to within about 9% (it is the upper edge of its
+    bucket, or the maximum if that is smaller); the count, total and
+    maximum are exact.  Histograms of several games can be merged.
+  """
+  MIN_SECONDS = 1e-6
+  BUCKET_RATIO = 2 ** (1.0 / 8)
+  NUM_BUCKETS = 8 * 34 # Up to about 4.7 hours; longer durations share the last bucket
+
+  def __init__(self):
+    self.counts = [0] * self.NUM_BUCKETS
+    self.count = 0
+    self.total = 0.0
+    self.max = 0.0
+
+  def add(self, seconds):
+    if seconds < self.MIN_SECONDS:
+      bucket = 0
+    else:
+      bucket = min(int(math.log(seconds / self.MIN_SECONDS, self.BUCKET_RATIO)) + 1, self.NUM_BUCKETS - 1)
+    self.counts[bucket] += 1
+    self.count += 1
+    self.total += seconds
+    if seconds > self.max: self.max = seconds
+
+  def merge(self, other):
+    "Adds the durations counted by other to this histogram."
+    self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+    self.count += other.count
+    self.total += other.total
+    self.max = max(self.max, other.max)
+
+  def percentile(self, p):
+    "Returns (an upper bound within one bucket of) the p-th percentile, 0 < p <= 100."
+    if self.count == 0: return 0.0
+    rank = max(1, int(math.ceil(p / 100.0 * self.count)))
+    seen = 0
+    for bucket, n in enumerate(self.counts):
+      seen += n
+      if seen >= rank: break
+    return min(self.MIN_SECONDS * self.BUCKET_RATIO ** bucket, self.max)
+
+  def getMean(self):
+    if self.count == 0: return 0.0
+    return self.total / self.count
+
+  def getSummary(self):
+    "Returns a dict with p50, p90, p99, max, total (seconds) and count."
+    return {'p50': self.percentile(50), 'p90': self.percentile(90), 'p99': self.percentile(99),
+            'max': self.max, 'total': self.total, 'count': self.count}
+
+  def __str__(self):
+    if self.count == 0: return 'no moves'
+    return 'p50 %s  p90 %s  p99 %s  max %s  total %.2fs  (%d moves)' % (
+      formatSeconds(self.percentile(50)), formatSeconds(self.percentile(90)),
+      formatSeconds(self.percentile(99)), formatSeconds(self.max), self.total, self.count)
+
+def formatSeconds(seconds):
+  "A short, readable form of a duration: 850us, 12.3ms, 1.50s."
+  if seconds < 1e-3: return '%dus' % round(seconds * 1e6)
+  if seconds < 1: return '%.1fms' % (seconds * 1e3)
+  return '%.2fs' % seconds
+
+
 def manhattanDistance( xy1, xy2 ):
   "Returns the Manhattan distance between points xy1 and xy2"
   return abs( xy1[0] - xy2[0] ) + abs( xy1[1] - xy2[1] )
@@ -485,3 +631,88 @@ class TimeoutFunction:
             signal.signal(signal.SIGALRM, old)
         signal.alarm(0)
         return result
+
+
+import ctypes
+import threading
+import time
+class Watchdog:
+    """
+    Enforces time limits on calls for one game, from any thread, without
+    signals: a helper thread sleeps until the running call's deadline and
+    then raises TimeoutFunctionException inside the calling thread.
+    Timeouts can be fractions of a second.  The helper thread is started
+    by the first call and stops on close().
+
+      watchdog.call(timeout, function, *args)
+
+    The exception is delivered when the call next runs Python code, so a
+    call stuck inside a single long C function is only stopped once that
+    function returns.
+    """
+
+    def __init__(self):
+        self.armed = None  # (call number, thread id, deadline) of the running call
+        self.calls = 0
+        self.firing = None # Call the helper thread is deciding to stop
+        self.fired = None  # Last call it stopped
+        self.closed = False
+        self.changed = threading.Event()
+        self.thread = None
+
+    def call(self, timeout, function, *args):
+        """
+        Returns function(*args), or raises TimeoutFunctionException if it
+        runs longer than timeout seconds.
+        """
+        if timeout <= 0:
+            raise TimeoutFunctionException()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._watch, name='Watchdog', daemon=True)
+            self.thread.start()
+        self.calls += 1
+        token = self.calls
+        ident = threading.get_ident()
+        self.armed = (token, ident, time.monotonic() + timeout)
+        self.changed.set()
+        try:
+            return function(*args)
+        finally:
+            # Disarm without locks (the exception may arrive at any point);
+            # a timeout raised after the call returned still counts as one.
+            self.armed = None
+            while self.firing == token:
+                time.sleep(0)
+            if self.fired == token:
+                _raiseInThread(ident, None) # Drop it if it is still pending
+                raise TimeoutFunctionException()
+
+    def _watch(self):
+        while not self.closed:
+            self.changed.clear()
+            armed = self.armed
+            if armed is None or self.fired == armed[0]:
+                self.changed.wait()
+                continue
+            token, ident, deadline = armed
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                self.changed.wait(delay)
+                continue
+            self.firing = token
+            if self.armed is armed:
+                self.fired = token
+                _raiseInThread(ident, TimeoutFunctionException)
+            self.firing = None
+
+    def close(self):
+        "Stops the helper thread."
+        self.closed = True
+        self.changed.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+def _raiseInThread(ident, exceptionType):
+    "Raises exceptionType in the thread ident when it next runs Python code (None: cancels that)."
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(ident), ctypes.py_object(exceptionType) if exceptionType else None)